@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Analysis Service
+Standalone HTTP service around one warm WoundAnalyzer, for hosts that call the
+analyzer directly instead of through server.js. Analyses run on a fixed-size
+thread pool (OpenCV releases the GIL, so threads share one analyzer and its
+colour table). Requests beyond the pool wait in a bounded FIFO queue; when the
+queue is full the request is refused at once with a Retry-After hint instead
+of piling up. A request whose deadline passes while it is still queued is
+dropped before it starts. With more than one worker, diagnostics report stage
+times but no peak allocation: tracemalloc counts every thread in the process.
+
+Endpoints:
+    POST /analyze   JSON request as for trauma_eye.py ({"image": base64, ...},
+                    or {"op": ...}); or raw image bytes (image/* or
+                    application/octet-stream) with overlay, wound_id,
+                    patient_id, captured_at, diagnostics and budget_ms as
+                    query parameters.
+                    An X-Deadline-Ms header (or "deadline_ms" in JSON) bounds
+                    the time the request may wait in the queue; whatever is
+                    left of it when a worker starts becomes the analysis's
+                    time budget (see WoundAnalyzer.analyze's budget_ms).
+    GET  /health    queue depth, in-flight count and request counters
+    GET  /metrics   stage histograms (Prometheus text; ?format=json for JSON)
+
+Usage:
+    python3 analysis_service.py --port 8765 --workers 4 --queue-size 16
+    python3 analysis_service.py --socket /run/trauma-eye.sock
+"""
+
+import sys
+import json
+import math
+import time
+import signal
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, Any, Optional, Tuple
+
+from trauma_eye import WoundAnalyzer, analyze_request, metrics_request
+from result_cache import ResultCache
+from wound_history import WoundHistory
+from diagnostics import StageMetrics
+from buffer_pool import BufferPool
+
+
+# Same ceiling as server.js's JSON body limit
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+    504: 'Gateway Timeout'
+}
+
+
+class QueueFullError(Exception):
+    """The request queue is at capacity; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__('Analysis queue is full')
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before a worker picked it up"""
+
+
+class AnalysisService:
+    """Bounded queue in front of a thread pool sharing one analyzer"""
+
+    def __init__(self, analyzer: WoundAnalyzer, workers: int = 2, queue_size: int = 16,
+                 default_deadline: float = 30.0):
+        self.analyzer = analyzer
+        self.workers = workers
+        if workers > 1:
+            # Peak allocation would mix in the other workers' analyses
+            analyzer.trace_memory = False
+        self.queue_size = queue_size
+        self.default_deadline = default_deadline
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+        self._pending = deque()
+        self.in_flight = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self._service_seconds = 0.0
+
+    async def submit(self, input_data: Dict, deadline_seconds: float = None) -> Dict[str, Any]:
+        """
+        Queue one analyze_request and wait for its result
+        Raises QueueFullError when the queue is at capacity, and
+        DeadlineExceeded when the deadline passes while still queued. A
+        deadline given by the caller also bounds the analysis itself: the
+        time left when a worker starts is its budget_ms, unless the request
+        sets one.
+        """
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.queue_size:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        budget = self.default_deadline if deadline_seconds is None else deadline_seconds
+        job = {'input': input_data, 'future': loop.create_future(), 'timer': None,
+               'deadline': None if deadline_seconds is None else loop.time() + budget}
+        job['timer'] = loop.call_later(max(budget, 0.0), self._expire, job)
+        self._pending.append(job)
+        self._dispatch()
+        return await job['future']
+
+    def health(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            'status': 'full' if len(self._pending) >= self.queue_size else 'ok',
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'queue_depth': len(self._pending),
+            'queue_capacity': self.queue_size,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'expired': self.expired,
+            'avg_service_ms': round(self._service_seconds / finished * 1000, 1) if finished else None
+        }
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained (at least 1)"""
+        finished = self.completed + self.failed
+        average = self._service_seconds / finished if finished else 1.0
+        backlog = len(self._pending) + self.in_flight
+        return max(1, math.ceil(backlog * average / self.workers))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _expire(self, job: Dict):
+        """Deadline timer: drop the job if no worker has taken it yet"""
+        if job in self._pending:
+            self._pending.remove(job)
+            self.expired += 1
+            if not job['future'].done():
+                job['future'].set_exception(DeadlineExceeded('Deadline passed while queued'))
+
+    def _dispatch(self):
+        """Start queued jobs, oldest first, while workers are free"""
+        loop = asyncio.get_running_loop()
+        while self._pending and self.in_flight < self.workers:
+            job = self._pending.popleft()
+            job['timer'].cancel()
+            if job['future'].done():
+                continue  # Caller went away
+            if job['deadline'] is not None and job['input'].get('budget_ms') is None:
+                job['input']['budget_ms'] = max((job['deadline'] - loop.time()) * 1000, 0.0)
+            self.in_flight += 1
+            started = time.perf_counter()
+            task = loop.run_in_executor(self._executor, analyze_request, self.analyzer, job['input'])
+            task.add_done_callback(lambda done, job=job, started=started: self._finish(job, done, started))
+
+    def _finish(self, job: Dict, done: asyncio.Future, started: float):
+        self.in_flight -= 1
+        self._service_seconds += time.perf_counter() - started
+        future = job['future']
+        if done.exception() is not None:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(done.exception())
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(done.result())
+        self._dispatch()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """(method, target, headers, body) of one HTTP/1.1 request, or None at end of stream"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError('Malformed request line')
+    method, target, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_BYTES:
+        raise OverflowError(f'Body larger than {MAX_BODY_BYTES} bytes')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+def _response(status: int, body, headers: Dict[str, str] = None, keep_alive: bool = True) -> bytes:
+    """Serialized response; dict/list bodies are sent as JSON, strings as text"""
+    headers = dict(headers or {})
+    if isinstance(body, (dict, list)):
+        payload = json.dumps(body).encode('utf-8')
+        content_type = headers.pop('Content-Type', 'application/json')
+    else:
+        payload = body.encode('utf-8')
+        content_type = headers.pop('Content-Type', 'text/plain; charset=utf-8')
+    lines = [f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}',
+             f'Content-Type: {content_type}',
+             f'Content-Length: {len(payload)}',
+             f'Connection: {"keep-alive" if keep_alive else "close"}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload
+
+
+def _analysis_input(headers: Dict[str, str], query: Dict[str, str], body: bytes) -> Tuple[Dict, Optional[float]]:
+    """The analyze_request object and deadline (seconds) of a POST /analyze"""
+    content_type = headers.get('content-type', '').split(';')[0].strip()
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        input_data = {
+            'image': body,
+            'overlay': query.get('overlay'),
+            'wound_id': query.get('wound_id'),
+            'patient_id': query.get('patient_id'),
+            'captured_at': query.get('captured_at'),
+            'diagnostics': query.get('diagnostics') in ('1', 'true'),
+            'budget_ms': float(query['budget_ms']) if query.get('budget_ms') else None
+        }
+    else:
+        input_data = json.loads(body or b'{}')
+        if not isinstance(input_data, dict):
+            raise ValueError('Request body must be a JSON object')
+
+    deadline_ms = headers.get('x-deadline-ms') or input_data.pop('deadline_ms', None)
+    return input_data, float(deadline_ms) / 1000 if deadline_ms is not None else None
+
+
+async def handle_request(service: AnalysisService, method: str, target: str,
+                         headers: Dict[str, str], body: bytes) -> Tuple[int, Any, Dict[str, str]]:
+    """(status, body, extra headers) for one request"""
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+    if url.path == '/health':
+        return 200, service.health(), {}
+
+    if url.path == '/metrics':
+        output_format = 'json' if query.get('format') == 'json' else 'prometheus'
+        result = metrics_request(service.analyzer, {'format': output_format})
+        if result.get('error'):
+            return 404, result, {}
+        if output_format == 'prometheus':
+            return 200, result['text'], {'Content-Type': result['content_type']}
+        return 200, result, {}
+
+    if url.path != '/analyze':
+        return 404, {'error': True, 'message': f'No route for {url.path}'}, {}
+    if method != 'POST':
+        return 405, {'error': True, 'message': 'Use POST /analyze'}, {'Allow': 'POST'}
+
+    try:
+        input_data, deadline = _analysis_input(headers, query, body)
+    except (ValueError, UnicodeDecodeError) as e:
+        return 400, {'error': True, 'message': f'Invalid request: {str(e)}'}, {}
+
+    try:
+        result = await service.submit(input_data, deadline)
+    except QueueFullError as e:
+        return 503, {'error': True, 'message': str(e), 'retry_after': e.retry_after}, \
+            {'Retry-After': str(e.retry_after)}
+    except DeadlineExceeded as e:
+        return 504, {'error': True, 'message': str(e)}, {}
+    except Exception as e:
+        return 500, {'error': True, 'message': f'Unexpected error: {str(e)}'}, {}
+
+    return (400 if result.get('error') else 200), result, {}
+
+
+async def handle_connection(service: AnalysisService, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+    """Serve keep-alive requests on one connection until the client closes it"""
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except OverflowError as e:
+                writer.write(_response(413, {'error': True, 'message': str(e)}, keep_alive=False))
+                break
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                writer.write(_response(400, {'error': True, 'message': f'Bad request: {str(e)}'},
+                                       keep_alive=False))
+                break
+            if request is None:
+                break
+
+            method, target, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            status, payload, extra = await handle_request(service, method, target, headers, body)
+            writer.write(_response(status, payload, extra, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run(service: AnalysisService, host: str = '127.0.0.1', port: int = 8765,
+              socket_path: str = None):
+    """Listen on a Unix socket (socket_path) or TCP host:port until SIGINT/SIGTERM"""
+    def handler(reader, writer):
+        return handle_connection(service, reader, writer)
+
+    if socket_path:
+        server = await asyncio.start_unix_server(handler, path=socket_path)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        where = f'{host}:{port}'
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(json.dumps({'ready': True, 'listening': where, 'workers': service.workers,
+                      'queue_size': service.queue_size}), flush=True)
+    async with server:
+        await stop.wait()
+    service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trauma Eye analysis service (HTTP over TCP or a Unix socket)')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port (default: 8765)')
+    parser.add_argument('--socket', default=None, help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, default=2, help='concurrent analyses (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='requests allowed to wait for a worker before new ones are refused (default: 16)')
+    parser.add_argument('--deadline', type=float, default=30.0,
+                        help='default seconds a request may wait in the queue (default: 30)')
+    parser.add_argument('--cache', action='store_true', help='keep an in-memory result cache')
+    parser.add_argument('--history-db', default=None, help='SQLite file of per-wound signatures')
+    parser.add_argument('--tile-threads', type=int, default=0,
+                        help='split large frames into bands processed on this many threads (default: 0)')
+    parser.add_argument('--buffer-pool-mb', type=int, default=256,
+                        help='MB of per-request intermediates kept for reuse (default: 256, 0 disables)')
+    parser.add_argument('--max-working-edge', type=int, default=None,
+                        help='segment on a reduced pyramid level with at most this long an edge '
+                             '(default: full resolution)')
+    args = parser.parse_args()
+
+    analyzer = WoundAnalyzer(cache=ResultCache() if args.cache else None,
+                             history=WoundHistory(args.history_db) if args.history_db else None,
+                             metrics=StageMetrics(), color_lut=True, tile_threads=args.tile_threads,
+                             buffer_pool=BufferPool(args.buffer_pool_mb * 1024 * 1024)
+                             if args.buffer_pool_mb > 0 else None,
+                             max_working_edge=args.max_working_edge)
+    analyzer.warm_up()
+
+    service = AnalysisService(analyzer, workers=args.workers, queue_size=args.queue_size,
+                              default_deadline=args.deadline)
+    try:
+        asyncio.run(run(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Benchmarks
+Times each WoundAnalyzer stage and end-to-end `analyze` on synthetic wound
+photos (see synthetic_wounds.py), writes the timings as a JSON baseline, and
+fails when a later run is slower than the baseline beyond a tolerance.
+
+Stages run in pipeline order on a fresh FrameContext each repeat, so a plane
+shared by several stages (gray, colour classes, wound mask) is charged to the first stage
+that needs it, as it is in `analyze`.
+
+Usage:
+    python3 benchmark_trauma_eye.py --save baseline.json
+    python3 benchmark_trauma_eye.py --baseline baseline.json --tolerance 0.25
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import cv2
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from trauma_eye import WoundAnalyzer, FrameContext
+from synthetic_wounds import RESOLUTIONS, SCENARIOS, generate, encode
+
+
+STAGES = ('decode', 'quality', 'detect', 'classify', 'infection', 'annotate', 'encode', 'analyze')
+
+
+def _time_stages(analyzer: WoundAnalyzer, image_bytes: bytes) -> Dict[str, Optional[float]]:
+    """Milliseconds per stage for one pass; stages the pipeline never reaches are None"""
+    timings = dict.fromkeys(STAGES)
+    clock = time.perf_counter
+
+    start = clock()
+    img = analyzer._decode_image(image_bytes)
+    timings['decode'] = (clock() - start) * 1000
+    if img is None:
+        return timings
+
+    ctx = FrameContext(img, analyzer)
+    start = clock()
+    quality = analyzer._check_photo_quality(ctx)
+    timings['quality'] = (clock() - start) * 1000
+    if not quality['is_acceptable']:
+        return timings
+
+    start = clock()
+    work_ctx = ctx.working_level(analyzer.max_working_edge)
+    regions = analyzer._find_wounds(work_ctx)
+    timings['detect'] = (clock() - start) * 1000
+    if not regions:
+        return timings
+
+    # Every wound is classified and checked for infection, as in `analyze`
+    labels, contours = analyzer._rank_wounds(work_ctx, regions)
+    start = clock()
+    for contour in contours:
+        analyzer._measure_wound(contour)
+        analyzer._classify_wound(ctx, contour)
+    timings['classify'] = (clock() - start) * 1000
+
+    start = clock()
+    analyzer._detect_wound_infections(work_ctx, labels)
+    timings['infection'] = (clock() - start) * 1000
+
+    start = clock()
+    annotated = analyzer._draw_annotations(img.copy(), contours)
+    timings['annotate'] = (clock() - start) * 1000
+
+    start = clock()
+    analyzer._encode_image(annotated)
+    timings['encode'] = (clock() - start) * 1000
+    return timings
+
+
+def benchmark_case(analyzer: WoundAnalyzer, image_bytes: bytes, repeat: int) -> Dict[str, Optional[float]]:
+    """Median milliseconds per stage over `repeat` passes, after one warm-up pass"""
+    _time_stages(analyzer, image_bytes)
+    analyzer.analyze(image_bytes)
+
+    samples = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        for stage, ms in _time_stages(analyzer, image_bytes).items():
+            if ms is not None:
+                samples[stage].append(ms)
+
+        start = time.perf_counter()
+        analyzer.analyze(image_bytes)
+        samples['analyze'].append((time.perf_counter() - start) * 1000)
+
+    return {stage: round(statistics.median(values), 3) if values else None
+            for stage, values in samples.items()}
+
+
+def run_benchmarks(resolutions: List[str], scenarios: List[str], repeat: int = 5,
+                   seed: int = 0, progress: bool = True, color_lut: bool = False,
+                   tile_threads: int = 0) -> Dict[str, Any]:
+    """Benchmark every (resolution, scenario) case; returns the baseline document"""
+    analyzer = WoundAnalyzer(color_lut=color_lut, tile_threads=tile_threads)
+    cases = {}
+
+    for resolution in resolutions:
+        for scenario in scenarios:
+            name = f'{resolution}/{scenario}'
+            image_bytes = encode(generate(scenario, resolution, seed))
+            cases[name] = benchmark_case(analyzer, image_bytes, repeat)
+            if progress:
+                print(f"{name:<18} analyze {cases[name]['analyze']:9.2f} ms", file=sys.stderr)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_threads': cv2.getNumThreads()
+        },
+        'settings': {'repeat': repeat, 'seed': seed, 'color_lut': color_lut, 'tile_threads': tile_threads},
+        'cases': cases
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            min_delta_ms: float) -> List[Dict[str, Any]]:
+    """
+    Stages slower than baseline * (1 + tolerance)
+    Differences under `min_delta_ms` are ignored, so timer noise on
+    sub-millisecond stages never counts as a regression.
+    """
+    regressions = []
+    for name, stages in current['cases'].items():
+        base_stages = baseline.get('cases', {}).get(name)
+        if not base_stages:
+            continue
+        for stage, ms in stages.items():
+            base_ms = base_stages.get(stage)
+            if ms is None or base_ms is None:
+                continue
+            if ms > base_ms * (1 + tolerance) and ms - base_ms > min_delta_ms:
+                regressions.append({
+                    'case': name,
+                    'stage': stage,
+                    'baseline_ms': base_ms,
+                    'current_ms': ms,
+                    'change_percent': round((ms - base_ms) / base_ms * 100, 1) if base_ms else None
+                })
+    return regressions
+
+
+def print_table(results: Dict[str, Any], baseline: Dict[str, Any] = None):
+    """Per-case stage timings, with the change against a baseline if given"""
+    header = f"{'case':<18}" + ''.join(f'{stage:>14}' for stage in STAGES)
+    print(header)
+    for name, stages in results['cases'].items():
+        row = f'{name:<18}'
+        base_stages = (baseline or {}).get('cases', {}).get(name, {})
+        for stage in STAGES:
+            ms = stages.get(stage)
+            base_ms = base_stages.get(stage)
+            if ms is None:
+                row += f"{'-':>14}"
+            elif base_ms:
+                row += f'{ms:>8.1f}{(ms - base_ms) / base_ms * 100:+5.0f}%'
+            else:
+                row += f'{ms:>14.2f}'
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-stage WoundAnalyzer benchmarks on synthetic wound photos')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help=f"comma-separated subset of: {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes per case (median is kept)')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic image seed')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='OpenCV thread count (default: OpenCV decides; use 1 for stable numbers)')
+    parser.add_argument('--color-lut', action='store_true',
+                        help='classify colours through the lookup table, as long-lived workers do')
+    parser.add_argument('--tile-threads', type=int, default=0,
+                        help='split large frames into bands on this many threads (default: 0, whole-frame)')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown per stage as a fraction of the baseline (default: 0.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='ignore slowdowns smaller than this many milliseconds (default: 0.5)')
+    args = parser.parse_args()
+
+    resolutions = args.resolutions.split(',')
+    scenarios = args.scenarios.split(',')
+    for resolution in resolutions:
+        if resolution not in RESOLUTIONS:
+            parser.error(f"unknown resolution '{resolution}'")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario '{scenario}'")
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(resolutions, scenarios, repeat=args.repeat, seed=args.seed,
+                             color_lut=args.color_lut, tile_threads=args.tile_threads)
+    print_table(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}", file=sys.stderr)
+
+    if baseline is None:
+        return
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r['case']:<18} {r['stage']:<10} {r['baseline_ms']:.2f} -> {r['current_ms']:.2f} ms "
+                  f"({r['change_percent']:+.1f}%)")
+        sys.exit(1)
+    print(f"\nNo stage regressed beyond {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Bulk Wound Analysis
+Re-scores a directory (or manifest) of wound photos across a pool of worker
+processes, streaming one result per image to a JSONL or CSV file. Images that
+already have a row in the output file are skipped, so an interrupted run can
+simply be started again.
+
+Usage:
+    python3 bulk_analyze.py photos/ -o results.jsonl --workers 8 --no-overlay
+    python3 bulk_analyze.py manifest.txt -o results.csv
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Set, Any
+
+from trauma_eye import WoundAnalyzer, OVERLAY_MODES
+from buffer_pool import BufferPool
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+CSV_COLUMNS = [
+    'path', 'error', 'risk', 'confidence', 'wound_types', 'infection_risk',
+    'infection_signs', 'area_pixels', 'width_pixels', 'length_pixels',
+    'quality_score', 'brightness', 'sharpness'
+]
+
+# Per-process analyzer, created once by the pool initializer
+_analyzer = None
+_overlay = 'none'
+
+
+def collect_images(source: str) -> List[str]:
+    """List image paths from a directory tree or a manifest file (one path per line)"""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    # Manifest: relative paths are resolved against the manifest's directory
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def load_completed(output_path: str, output_format: str) -> Set[str]:
+    """Paths already present in an existing output file"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'r', newline='') as f:
+        if output_format == 'csv':
+            for row in csv.DictReader(f):
+                if row.get('path'):
+                    completed.add(row['path'])
+        else:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)['path'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # Truncated last line from an interrupted run
+    return completed
+
+
+def to_csv_row(path: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten one analysis result into the CSV columns"""
+    measurements = result.get('measurements') or {}
+    infection = result.get('infection_analysis') or {}
+    quality = result.get('photo_quality') or {}
+
+    return {
+        'path': path,
+        'error': result['message'] if result.get('error') else '',
+        'risk': result.get('risk', ''),
+        'confidence': result.get('confidence', ''),
+        'wound_types': '; '.join(result.get('wound_types') or []),
+        'infection_risk': infection.get('risk_level', ''),
+        'infection_signs': '; '.join(infection.get('signs') or []),
+        'area_pixels': measurements.get('area_pixels', ''),
+        'width_pixels': measurements.get('width_pixels', ''),
+        'length_pixels': measurements.get('length_pixels', ''),
+        'quality_score': quality.get('quality_score', ''),
+        'brightness': quality.get('brightness', ''),
+        'sharpness': quality.get('sharpness', '')
+    }
+
+
+def _init_worker(overlay: str, max_working_edge: Optional[int] = None):
+    """Pool initializer - build one analyzer per worker process"""
+    global _analyzer, _overlay
+    _analyzer = WoundAnalyzer(color_lut=True, buffer_pool=BufferPool(), max_working_edge=max_working_edge)
+    _overlay = overlay
+
+
+def _analyze_file(path: str):
+    """Analyze one image file from its raw bytes"""
+    try:
+        with open(path, 'rb') as f:
+            image_bytes = f.read()
+    except OSError as e:
+        return path, {'error': True, 'message': f'Failed to read image: {str(e)}'}
+
+    return path, _analyzer.analyze(image_bytes, overlay=_overlay)
+
+
+def run_bulk(source: str, output_path: str, workers: int = None, output_format: str = None,
+             overlay: str = 'full', progress_every: int = 100,
+             max_working_edge: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyze every image under `source`, appending results to `output_path`
+    Returns a summary with counts and throughput
+    """
+    if output_format is None:
+        output_format = 'csv' if output_path.lower().endswith('.csv') else 'jsonl'
+    workers = workers or os.cpu_count() or 1
+
+    paths = collect_images(source)
+    completed = load_completed(output_path, output_format)
+    pending = [p for p in paths if p not in completed]
+
+    print(f"{len(paths)} images found, {len(paths) - len(pending)} already done, "
+          f"{len(pending)} to analyze with {workers} workers", file=sys.stderr)
+
+    # Make sure appended rows don't run into a truncated last line
+    has_content = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    needs_newline = False
+    if has_content:
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+
+    write_header = output_format == 'csv' and not has_content
+    processed = 0
+    errors = 0
+    start = time.time()
+
+    with open(output_path, 'a', newline='') as out, \
+            Pool(workers, initializer=_init_worker, initargs=(overlay, max_working_edge)) as pool:
+        if needs_newline:
+            out.write('\n')
+
+        writer = None
+        if output_format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS)
+            if write_header:
+                writer.writeheader()
+
+        for path, result in pool.imap_unordered(_analyze_file, pending, chunksize=4):
+            if writer:
+                writer.writerow(to_csv_row(path, result))
+            else:
+                out.write(json.dumps({'path': path, 'result': result}) + '\n')
+
+            processed += 1
+            if result.get('error'):
+                errors += 1
+
+            if processed % progress_every == 0:
+                out.flush()
+                rate = processed / max(time.time() - start, 1e-9)
+                print(f"{processed}/{len(pending)} images ({rate:.1f} images/sec)", file=sys.stderr)
+
+    elapsed = time.time() - start
+    summary = {
+        'total': len(paths),
+        'skipped': len(paths) - len(pending),
+        'processed': processed,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 2),
+        'images_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0.0
+    }
+    print(f"Done: {processed} images in {elapsed:.1f}s "
+          f"({summary['images_per_second']} images/sec, {errors} errors)", file=sys.stderr)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk wound analysis over a directory or manifest of images')
+    parser.add_argument('source', help='directory of images, or a manifest file with one image path per line')
+    parser.add_argument('-o', '--output', required=True, help='output file (.jsonl or .csv)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                        help='output format (default: from the output file extension)')
+    parser.add_argument('--overlay', choices=OVERLAY_MODES, default='full',
+                        help='overlay mode stored with each result (default: full)')
+    parser.add_argument('--no-overlay', action='store_const', dest='overlay', const='none',
+                        help='same as --overlay none: skip drawing and encoding visual_overlay')
+    parser.add_argument('--max-working-edge', type=int, default=None,
+                        help='segment on a reduced pyramid level with at most this long an edge '
+                             '(default: full resolution)')
+    args = parser.parse_args()
+
+    summary = run_bulk(args.source, args.output, workers=args.workers, output_format=args.format,
+                       overlay=args.overlay, max_working_edge=args.max_working_edge)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Threshold Calibration
+Scores grids of colour thresholds and ratio cut-offs against labelled photos
+without analyzing any photo more than once.
+
+Each photo is analyzed once, up to wound detection. For every wound its
+profile keeps sparse 3-D HSV histograms of the wound pixels and of its
+inflammation ring (every hue; saturation and value in bins of 5), gray
+histograms of the wound pixels and of its bounding box, its area and the
+types its outline implies. Each swept threshold is a box in HSV or a cut-off
+in gray, so a pixel count under any setting is a lookup in a cumulative
+histogram, and a grid of thousands of settings scores in seconds. Results
+match what `analyze` returns under the same settings.
+
+The wound outlines themselves come from the red ranges, kernels and working
+resolution the profiles were made with; changing those needs new profiles.
+Profiles are cached per image and per such configuration.
+
+Saturation and value bounds must lie on bin edges: lower bounds a multiple
+of 5, upper bounds 4 more than a multiple of 5, or 255.
+
+Labels are a JSONL or CSV file with a `path` and the expected `risk`
+and/or `infection_risk` per photo; relative paths are resolved against the
+labels file. A grid is a JSON object mapping parameters (see PARAMETERS) to
+lists of candidate values, e.g.
+    {"discharge_ratio": [0.03, 0.05, 0.08],
+     "yellow_range": [[[20, 50, 50], [40, 255, 255]], [[15, 50, 50], [40, 255, 255]]]}
+
+Usage:
+    python3 calibration.py labels.csv grid.json --profiles profiles/ --top 10
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+import cv2
+import numpy as np
+from typing import Dict, List, Any, Tuple
+
+from trauma_eye import WoundAnalyzer, FrameContext, RISK_ORDER, BURN_TYPES
+from result_cache import ResultCache
+
+
+# Analyzer attributes a grid may vary; the ranges are (lower, upper) HSV bounds
+RANGE_PARAMETERS = ('yellow_range', 'green_range', 'intense_red_range')
+PARAMETERS = RANGE_PARAMETERS + (
+    'necrotic_gray', 'charred_gray', 'white_tissue_gray',
+    'discharge_ratio', 'necrotic_ratio', 'inflammation_ratio',
+    'burn_charred_ratio', 'burn_white_ratio', 'third_degree_ratio', 'second_degree_ratio'
+)
+
+# Outcomes a label can name: every risk level a result can carry, and the
+# infection risk of the wound the result describes
+RISK_LABELS = RISK_ORDER + ('UNKNOWN',)
+INFECTION_LABELS = ('LOW', 'MODERATE', 'HIGH')
+
+HUE_BINS = 180
+SV_STEP = 5
+SV_BINS = 256 // SV_STEP + 1    # 0-4, 5-9, ..., 250-254, 255
+
+PROFILE_VERSION = 1
+
+# Settings scored per vectorized step (bounds the (wounds x settings) arrays)
+CHUNK_SETTINGS = 512
+
+
+def profile_fingerprint(analyzer: WoundAnalyzer) -> str:
+    """The analyzer configuration a profile depends on (not the swept thresholds)"""
+    config = json.loads(analyzer.config_fingerprint())
+    for key in ('yellow_range', 'green_range', 'intense_red_range', 'gray',
+                'infection_ratios', 'burn_ratios'):
+        config.pop(key, None)
+    config['profile_version'] = PROFILE_VERSION
+    return json.dumps(config, sort_keys=True)
+
+
+def extract_profile(analyzer: WoundAnalyzer, image_bytes: bytes) -> Dict[str, np.ndarray]:
+    """Histograms of one photo's wounds, found as `analyze` finds them"""
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    if analyzer._fast_quality_gate(buffer) is not None:
+        return _profile('rejected', [])
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        return _profile('unreadable', [])
+
+    ctx = FrameContext(img, analyzer)
+    if not analyzer._check_photo_quality(ctx)['is_acceptable']:
+        return _profile('rejected', [])
+
+    work_ctx = ctx.working_level(analyzer.max_working_edge)
+    labels, contours = analyzer._rank_wounds(work_ctx, analyzer._find_wounds(work_ctx))
+    if not labels:
+        return _profile('ok', [])
+
+    # Every wound and its ring lie in one window of the working level
+    ring_radius = analyzer._ring_radius(work_ctx)
+    window = analyzer._infection_window(work_ctx, labels, ring_radius)
+    label_view = work_ctx.wound_components[1][window]
+    gray_view = work_ctx.gray[window]
+    hsv = cv2.cvtColor(work_ctx.img[window], cv2.COLOR_BGR2HSV)
+    codes = hsv_codes(hsv)
+    ring, nearest = analyzer._inflammation_rings(work_ctx, labels, ring_radius, window)
+    ring = ring > 0
+
+    wounds = []
+    for label, contour in zip(labels, contours):
+        in_wound = label_view == label
+        in_ring = ring if nearest is None else ring & (nearest == label)
+        x, y, w, h = cv2.boundingRect(contour)
+        wounds.append({
+            'wound': np.unique(codes[in_wound], return_counts=True),
+            'ring': np.unique(codes[in_ring], return_counts=True),
+            'wound_gray': np.bincount(gray_view[in_wound], minlength=256),
+            'box_gray': np.bincount(ctx.gray[y:y+h, x:x+w].ravel(), minlength=256),
+            'area': analyzer._measure_wound(contour)['area_pixels'],
+            'shape_types': analyzer._shape_types(contour)
+        })
+    return _profile('ok', wounds)
+
+
+def hsv_codes(hsv: np.ndarray) -> np.ndarray:
+    """Flat histogram bin of every HSV pixel: hue, then saturation and value bins"""
+    saturation = (hsv[..., 1] // SV_STEP).astype(np.int32)
+    value = (hsv[..., 2] // SV_STEP).astype(np.int32)
+    return (hsv[..., 0].astype(np.int32) * SV_BINS + saturation) * SV_BINS + value
+
+
+def _profile(status: str, wounds: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Profile arrays, as stored: sparse histograms concatenated over wounds"""
+    def sparse(key):
+        offsets = np.cumsum([0] + [len(wound[key][0]) for wound in wounds])
+        bins = np.concatenate([wound[key][0] for wound in wounds] or [[]]).astype(np.uint32)
+        counts = np.concatenate([wound[key][1] for wound in wounds] or [[]]).astype(np.uint32)
+        return offsets, bins, counts
+
+    profile = {'status': np.array(status)}
+    for key in ('wound', 'ring'):
+        profile[f'{key}_offsets'], profile[f'{key}_bins'], profile[f'{key}_counts'] = sparse(key)
+    for key in ('wound_gray', 'box_gray'):
+        profile[key] = np.array([wound[key] for wound in wounds], np.uint32).reshape(-1, 256)
+    profile['area'] = np.array([wound['area'] for wound in wounds], np.int64)
+    profile['shape_types'] = np.array(json.dumps([wound['shape_types'] for wound in wounds]))
+    return profile
+
+
+def load_profiles(analyzer: WoundAnalyzer, paths: List[str], directory: str = None,
+                  progress_every: int = 100) -> List[Dict[str, np.ndarray]]:
+    """
+    Profile of every image in `paths`, from `directory` when cached there
+    Missing profiles are extracted and, with a directory, saved for next time.
+    """
+    fingerprint = profile_fingerprint(analyzer)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    profiles = []
+    extracted = 0
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                image_bytes = f.read()
+        except OSError:
+            profiles.append(_profile('unreadable', []))
+            continue
+
+        cache_path = None
+        if directory:
+            cache_path = os.path.join(directory, ResultCache.make_key(image_bytes, fingerprint) + '.npz')
+            if os.path.exists(cache_path):
+                with np.load(cache_path) as stored:
+                    profiles.append(dict(stored))
+                continue
+
+        profile = extract_profile(analyzer, image_bytes)
+        if cache_path:
+            np.savez_compressed(cache_path, **profile)
+        profiles.append(profile)
+
+        extracted += 1
+        if extracted % progress_every == 0:
+            print(f"{extracted} profiles extracted", file=sys.stderr)
+    return profiles
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    """Labelled photos from a JSONL or CSV file, with absolute paths"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    labels = []
+    for row in rows:
+        image_path = row['path']
+        labels.append({
+            'path': image_path if os.path.isabs(image_path) else os.path.join(base_dir, image_path),
+            'risk': row.get('risk') or None,
+            'infection_risk': row.get('infection_risk') or None
+        })
+    return labels
+
+
+def current_config(analyzer: WoundAnalyzer) -> Dict[str, Any]:
+    """The analyzer's own values of every sweepable parameter"""
+    config = {}
+    for name in PARAMETERS:
+        value = getattr(analyzer, name)
+        config[name] = _range_key(value) if name in RANGE_PARAMETERS else value
+    return config
+
+
+def apply_config(analyzer: WoundAnalyzer, config: Dict[str, Any]):
+    """Set the analyzer's thresholds to a (possibly partial) configuration"""
+    for name, value in config.items():
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown calibration parameter '{name}'")
+        if name in RANGE_PARAMETERS:
+            value = tuple(np.array(bound) for bound in value)
+        setattr(analyzer, name, value)
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of a grid's candidate values"""
+    for name in grid:
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown calibration parameter '{name}'")
+    names = list(grid)
+    candidates = [[_range_key(v) if name in RANGE_PARAMETERS else v for v in grid[name]]
+                  for name in names]
+    return [dict(zip(names, values)) for values in itertools.product(*candidates)]
+
+
+def _range_key(bounds) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    lower, upper = bounds
+    return tuple(int(v) for v in lower), tuple(int(v) for v in upper)
+
+
+def _range_box(bounds) -> Tuple[int, ...]:
+    """Histogram box (h0, h1, s0, s1, v0, v1), upper ends exclusive, of inclusive HSV bounds"""
+    (h_low, s_low, v_low), (h_high, s_high, v_high) = bounds
+    box = [min(max(h_low, 0), HUE_BINS), min(max(h_high + 1, 0), HUE_BINS)]
+    for low, high in ((s_low, s_high), (v_low, v_high)):
+        if (low > 0 and low % SV_STEP) or (high < 255 and (high + 1) % SV_STEP):
+            raise ValueError(f'Saturation/value bounds {list(bounds[0])}-{list(bounds[1])} '
+                             f'are not on {SV_STEP}-wide bin edges')
+        box += [min(max(low, 0), 255) // SV_STEP, min(max(high, -1), 255) // SV_STEP + 1]
+    return tuple(box)
+
+
+def _intersect(a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+    box = []
+    for axis in range(0, 6, 2):
+        low, high = max(a[axis], b[axis]), min(a[axis + 1], b[axis + 1])
+        box += [low, max(low, high)]
+    return tuple(box)
+
+
+def _segment_sums(offsets: np.ndarray, bins: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Total count of each wound's sparse histogram"""
+    return np.diff(np.concatenate([[0], np.cumsum(counts)])[offsets])
+
+
+class _BoxCounter:
+    """
+    Pixel counts of HSV boxes in many wounds' histograms, from one summed-area
+    table per wound over just the bin edges the boxes use
+    """
+
+    def __init__(self, offsets: np.ndarray, bins: np.ndarray, counts: np.ndarray,
+                 boxes: List[Tuple[int, ...]]):
+        wound_count = len(offsets) - 1
+        limits = (HUE_BINS, SV_BINS, SV_BINS)
+        self.edges = [np.unique([0, limits[axis]] + [box[2 * axis + i] for box in boxes for i in (0, 1)])
+                      for axis in range(3)]
+        shape = tuple(len(edges) - 1 for edges in self.edges)
+
+        # Re-bin every sparse entry into the cells between consecutive edges
+        coordinates = (bins // (SV_BINS * SV_BINS), bins // SV_BINS % SV_BINS, bins % SV_BINS)
+        cells = [np.searchsorted(edges, coordinate, side='right') - 1
+                 for edges, coordinate in zip(self.edges, coordinates)]
+        wound = np.repeat(np.arange(wound_count), np.diff(offsets))
+        flat = np.ravel_multi_index([wound] + cells, (wound_count,) + shape)
+        table = np.bincount(flat, weights=counts, minlength=wound_count * int(np.prod(shape)))
+        table = table.astype(np.int64).reshape((wound_count,) + shape)
+
+        # Summed-area table with a zero plane in front of each axis
+        sat = np.zeros((wound_count,) + tuple(n + 1 for n in shape), np.int64)
+        sat[:, 1:, 1:, 1:] = table.cumsum(1).cumsum(2).cumsum(3)
+        self.sat_shape = sat.shape[1:]
+        self.sat = sat.reshape(wound_count, int(np.prod(self.sat_shape)))
+
+    def count(self, box: Tuple[int, ...]) -> np.ndarray:
+        """Pixels inside `box`, for every wound"""
+        index = [np.searchsorted(edges, box[2 * axis:2 * axis + 2]) for axis, edges in enumerate(self.edges)]
+        total = 0
+        for corner in itertools.product((0, 1), repeat=3):
+            sign = (-1) ** (3 - sum(corner))
+            flat = np.ravel_multi_index([index[axis][corner[axis]] for axis in range(3)], self.sat_shape)
+            total = total + sign * self.sat[:, flat]
+        return total
+
+
+class Calibration:
+    """Labelled profiles, flattened to one row per wound for scoring settings"""
+
+    def __init__(self, analyzer: WoundAnalyzer, profiles: List[Dict[str, np.ndarray]],
+                 labels: List[Dict[str, Any]]):
+        self.analyzer = analyzer
+
+        # Unreadable photos have no outcome to score
+        kept = [(profile, label) for profile, label in zip(profiles, labels)
+                if str(profile['status']) != 'unreadable']
+        self.unreadable = len(profiles) - len(kept)
+        if not kept:
+            raise ValueError('No readable photos to calibrate against')
+        self.rejected = np.array([str(profile['status']) == 'rejected' for profile, _ in kept])
+        self.risk_labels = np.array([RISK_LABELS.index(label['risk']) if label['risk'] else -1
+                                     for _, label in kept])
+        self.infection_labels = np.array([INFECTION_LABELS.index(label['infection_risk'])
+                                          if label['infection_risk'] else -1 for _, label in kept])
+
+        wound_counts = np.array([len(profile['area']) for profile, _ in kept])
+        self.image_count = len(kept)
+        self.wound_starts = np.concatenate([[0], np.cumsum(wound_counts)[:-1]]).astype(np.int64)
+        self.wound_counts = wound_counts
+        self.wound_position = np.arange(int(wound_counts.sum())) - np.repeat(self.wound_starts, wound_counts)
+
+        def joined(key):
+            offsets, bins, counts = [0], [], []
+            for profile, _ in kept:
+                offsets.extend(offsets[-1] + profile[f'{key}_offsets'][1:])
+                bins.append(profile[f'{key}_bins'])
+                counts.append(profile[f'{key}_counts'])
+            return (np.array(offsets, np.int64), np.concatenate(bins or [[]]).astype(np.int64),
+                    np.concatenate(counts or [[]]).astype(np.int64))
+
+        self.wound_hsv = joined('wound')
+        self.ring_hsv = joined('ring')
+        self.wound_pixels = np.maximum(_segment_sums(*self.wound_hsv), 1)
+        self.ring_pixels = np.maximum(_segment_sums(*self.ring_hsv), 1)
+
+        def cumulative(key):
+            hist = np.concatenate([profile[key] for profile, _ in kept]).astype(np.int64).reshape(-1, 256)
+            return np.concatenate([np.zeros((len(hist), 1), np.int64), hist.cumsum(1)], axis=1)
+
+        self.wound_gray = cumulative('wound_gray')
+        self.box_gray = cumulative('box_gray')
+        self.box_size = self.box_gray[:, -1]
+
+        # The analyzer's own verdict for each combination of infection signs
+        # (discharge, necrotic, inflamed), and each wound's risk for each
+        # combination of burn degree (none, 1st, 2nd, 3rd) and infection risk
+        self.infection_table = np.array([
+            INFECTION_LABELS.index(analyzer._infection_from_signs(*signs)['risk_level'])
+            for signs in itertools.product((False, True), repeat=3)
+        ])
+        areas = np.concatenate([profile['area'] for profile, _ in kept]).astype(np.int64)
+        shape_types = [types for profile, _ in kept for types in json.loads(str(profile['shape_types']))]
+        self.risk_table = np.array([[[
+            RISK_ORDER.index(analyzer._calculate_risk(
+                {'area_pixels': int(area)}, ([burn] if burn else []) + types, {'risk_level': infection}
+            )[0])
+            for infection in INFECTION_LABELS] for burn in (None,) + BURN_TYPES]
+            for area, types in zip(areas, shape_types)
+        ]).reshape(-1, 4, 3)
+
+    def predict(self, configs: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (risk, infection) outcome indices of every photo under every setting,
+        each (photos x settings); infection is -1 where no wound was assessed
+        """
+        base = current_config(self.analyzer)
+        configs = [{**base, **config} for config in configs]
+        risk = np.empty((self.image_count, len(configs)), np.int64)
+        infection = np.empty((self.image_count, len(configs)), np.int64)
+
+        # Unique boxes per range, counted once per wound
+        boxes = {name: sorted({config[name] for config in configs}) for name in RANGE_PARAMETERS}
+        box_of = {name: {bounds: _range_box(bounds) for bounds in boxes[name]} for name in RANGE_PARAMETERS}
+        discharge_pairs = sorted({(config['yellow_range'], config['green_range']) for config in configs})
+        discharge_boxes = {pair: (box_of['yellow_range'][pair[0]], box_of['green_range'][pair[1]],
+                                  _intersect(box_of['yellow_range'][pair[0]], box_of['green_range'][pair[1]]))
+                           for pair in discharge_pairs}
+
+        wound_counter = _BoxCounter(*self.wound_hsv, [box for triple in discharge_boxes.values() for box in triple])
+        ring_counter = _BoxCounter(*self.ring_hsv, list(box_of['intense_red_range'].values()))
+        discharge_counts = np.stack([
+            wound_counter.count(yellow) + wound_counter.count(green) - wound_counter.count(both)
+            for yellow, green, both in discharge_boxes.values()
+        ], axis=1)
+        inflamed_counts = np.stack([ring_counter.count(box) for box in box_of['intense_red_range'].values()],
+                                   axis=1)
+        pair_index = {pair: i for i, pair in enumerate(discharge_pairs)}
+        red_index = {bounds: i for i, bounds in enumerate(boxes['intense_red_range'])}
+
+        # Per photo, the result describes its most severe wound, the largest on
+        # ties: the highest of risk * positions + (positions - 1 - position)
+        has_wounds = self.wound_counts > 0
+        starts = self.wound_starts[has_wounds]
+        positions = max(int(self.wound_counts.max(initial=0)), 1)
+        tie_break = positions - 1 - self.wound_position[:, None]
+
+        for start in range(0, len(configs), CHUNK_SETTINGS):
+            chunk = configs[start:start + CHUNK_SETTINGS]
+            columns = slice(start, start + len(chunk))
+
+            def values(name, dtype=np.float64):
+                return np.array([config[name] for config in chunk], dtype)
+
+            def gray_index(name, offset=0):
+                return np.clip(values(name, np.int64) + offset, 0, 256)
+
+            # Infection signs, as ratios of wound (or ring) pixels
+            discharge = discharge_counts[:, [pair_index[(c['yellow_range'], c['green_range'])] for c in chunk]]
+            necrotic = self.wound_gray[:, gray_index('necrotic_gray', 1)]
+            inflamed = inflamed_counts[:, [red_index[c['intense_red_range']] for c in chunk]]
+            signs = ((discharge / self.wound_pixels[:, None] > values('discharge_ratio')) * 4 +
+                     (necrotic / self.wound_pixels[:, None] > values('necrotic_ratio')) * 2 +
+                     (inflamed / self.ring_pixels[:, None] > values('inflammation_ratio')))
+            wound_infection = self.infection_table[signs]
+
+            # Burn degree from the box's gray levels, in float32 as _classify_wound has it
+            size = self.box_size[:, None].astype(np.float32)
+            charred = self.box_gray[:, gray_index('charred_gray')].astype(np.float32) / size
+            white = (self.box_size[:, None] - self.box_gray[:, gray_index('white_tissue_gray', 1)]
+                     ).astype(np.float32) / size
+            burn = np.where((charred > values('burn_charred_ratio', np.float32)) |
+                            (white > values('burn_white_ratio', np.float32)),
+                            np.where(charred > values('third_degree_ratio', np.float32), 3,
+                                     np.where(white > values('second_degree_ratio', np.float32), 2, 1)), 0)
+
+            wound_risk = self.risk_table[np.arange(len(burn))[:, None], burn, wound_infection]
+
+            risk[:, columns] = RISK_LABELS.index('NONE')
+            infection[:, columns] = -1
+            if len(starts):
+                best = np.maximum.reduceat(wound_risk * positions + tie_break, starts, axis=0)
+                primary = starts[:, None] + positions - 1 - best % positions
+                risk[has_wounds, columns] = best // positions
+                infection[has_wounds, columns] = np.take_along_axis(wound_infection, primary, axis=0)
+            risk[self.rejected, columns] = RISK_LABELS.index('UNKNOWN')
+        return risk, infection
+
+    def score(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Accuracy of every setting on each labelled outcome, and their mean"""
+        risk, infection = self.predict(configs)
+        accuracies = {}
+        for target, predicted, labels in (('risk', risk, self.risk_labels),
+                                          ('infection_risk', infection, self.infection_labels)):
+            labelled = labels >= 0
+            if labelled.any():
+                accuracies[target] = (predicted[labelled] == labels[labelled][:, None]).mean(axis=0)
+
+        rows = []
+        for index, config in enumerate(configs):
+            accuracy = {target: round(float(values[index]), 4) for target, values in accuracies.items()}
+            rows.append({
+                'config': {name: _to_json(value) for name, value in config.items()},
+                'score': round(float(np.mean(list(accuracy.values()))), 4) if accuracy else None,
+                'accuracy': accuracy
+            })
+        return rows
+
+
+def _to_json(value):
+    if isinstance(value, tuple):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def sweep(calibration: Calibration, grid: Dict[str, List[Any]], top: int = 10) -> Dict[str, Any]:
+    """Score every setting of `grid`; the best `top` first, with the current setting for reference"""
+    configs = expand_grid(grid)
+    start = time.perf_counter()
+    rows = calibration.score(configs)
+    elapsed = time.perf_counter() - start
+
+    rows.sort(key=lambda row: -(row['score'] or 0.0))
+    current = calibration.score([{}])[0]
+    current['config'] = {name: _to_json(value) for name, value in current_config(calibration.analyzer).items()
+                         if name in grid}
+    return {
+        'photos': calibration.image_count,
+        'wounds': len(calibration.box_size),
+        'unreadable': calibration.unreadable,
+        'settings': len(configs),
+        'sweep_seconds': round(elapsed, 3),
+        'current': current,
+        'best': rows[:top]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep analyzer thresholds against labelled wound photos')
+    parser.add_argument('labels', help='JSONL or CSV of path, risk and/or infection_risk per photo')
+    parser.add_argument('grid', help='JSON object of parameter -> list of candidate values')
+    parser.add_argument('--profiles', metavar='DIR', default=None,
+                        help='directory caching per-photo histogram profiles between sweeps')
+    parser.add_argument('--top', type=int, default=10, help='number of best settings to print')
+    parser.add_argument('--max-working-edge', type=int, default=None,
+                        help='working resolution the profiles are made at, as in analyze '
+                             '(default: full resolution)')
+    args = parser.parse_args()
+
+    with open(args.grid, 'r') as f:
+        grid = json.load(f)
+    labels = load_labels(args.labels)
+    analyzer = WoundAnalyzer(max_working_edge=args.max_working_edge)
+
+    start = time.perf_counter()
+    profiles = load_profiles(analyzer, [label['path'] for label in labels], args.profiles)
+    print(f"{len(profiles)} profiles ready in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    result = sweep(Calibration(analyzer, profiles, labels), grid, args.top)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
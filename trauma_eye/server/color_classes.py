@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Colour Classes
+Maps every pixel to a bitmask of the colour classes the analysis cares about
+(wound red, intense red, yellow/green discharge, necrotic, charred, white
+tissue) in one pass.
+
+The reference classifier converts to HSV and gray and applies the analyzer's
+inRange thresholds. Since both conversions are per-pixel functions of the BGR
+value, the same classifier run once over all 2^24 colours gives an exact
+lookup table; classifying a frame is then a single table read per pixel
+instead of two colour conversions and seven threshold passes. Building the
+table takes a few hundred milliseconds and 16 MiB, so it is meant for
+long-lived processes.
+"""
+
+import sys
+import threading
+import cv2
+import numpy as np
+from typing import Callable, Dict
+
+
+# Class bits
+WOUND_RED = 1           # red_ranges (either hue band)
+INTENSE_RED = 2         # intense_red_range
+DISCHARGE_YELLOW = 4    # yellow_range
+DISCHARGE_GREEN = 8     # green_range
+NECROTIC = 16           # gray <= necrotic_gray
+CHARRED = 32            # gray < charred_gray
+WHITE_TISSUE = 64       # gray > white_tissue_gray
+
+DISCHARGE = DISCHARGE_YELLOW | DISCHARGE_GREEN
+
+# Tables are shared by every analyzer in the process with the same thresholds
+_LUT_CACHE: Dict[bytes, np.ndarray] = {}
+_LUT_LOCK = threading.Lock()
+
+_CLASS_VALUES = np.arange(256)
+
+
+def class_mask(classes: np.ndarray, bits: int, dst: np.ndarray = None) -> np.ndarray:
+    """0/255 mask of pixels having any of `bits` (written into `dst` if given)"""
+    dst = cv2.bitwise_and(classes, bits, dst=dst)
+    return cv2.compare(dst, 0, cv2.CMP_GT, dst=dst)
+
+
+def class_count(histogram: np.ndarray, bits: int) -> int:
+    """Pixels having any of `bits`, from a 256-bin histogram of class values"""
+    return int(histogram[(_CLASS_VALUES & bits) != 0].sum())
+
+
+class ColorClassifier:
+    """Per-pixel colour classes under an analyzer's current thresholds"""
+
+    def __init__(self, analyzer, use_lut: bool = False):
+        self.analyzer = analyzer
+        # The table is indexed by a little-endian view of B, G, R, A bytes
+        self.use_lut = use_lut and sys.byteorder == 'little'
+
+    def classify(self, img: np.ndarray, allocate: Callable = np.empty) -> np.ndarray:
+        """
+        uint8 class bitmask of a BGR image (or view)
+        `allocate(shape, dtype)` supplies the output and scratch arrays, e.g.
+        from a BufferPool lease.
+        """
+        if self.use_lut:
+            return self._classify_lut(img, self.lut(), allocate)
+        return self.classify_reference(img, allocate)
+
+    def red_mask(self, hsv: np.ndarray, allocate: Callable = np.empty) -> np.ndarray:
+        """0/255 mask of WOUND_RED pixels, from the red hue bands of an HSV image"""
+        (lower, upper), *others = self.analyzer.red_ranges
+        mask = cv2.inRange(hsv, lower, upper, dst=allocate(hsv.shape[:2], np.uint8))
+        for lower, upper in others:
+            cv2.bitwise_or(mask, cv2.inRange(hsv, lower, upper), dst=mask)
+        return mask
+
+    def classify_reference(self, img: np.ndarray, allocate: Callable = np.empty, hsv: np.ndarray = None,
+                           gray: np.ndarray = None, red: np.ndarray = None) -> np.ndarray:
+        """
+        Class bitmask straight from the HSV/gray thresholds
+        `hsv`, `gray` and `red` (as from red_mask) are img's planes, when the
+        caller already has them.
+        """
+        analyzer = self.analyzer
+        if hsv is None:
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if red is None:
+            red = self.red_mask(hsv)
+        classes = allocate(img.shape[:2], np.uint8)
+        classes.fill(0)
+
+        def add(mask, bit):
+            cv2.bitwise_or(classes, bit, dst=classes, mask=mask)
+
+        add(red, WOUND_RED)
+        add(cv2.inRange(hsv, *analyzer.intense_red_range), INTENSE_RED)
+        add(cv2.inRange(hsv, *analyzer.yellow_range), DISCHARGE_YELLOW)
+        add(cv2.inRange(hsv, *analyzer.green_range), DISCHARGE_GREEN)
+        add(cv2.inRange(gray, 0, analyzer.necrotic_gray), NECROTIC)
+        add(cv2.inRange(gray, 0, analyzer.charred_gray - 1), CHARRED)
+        add(cv2.inRange(gray, analyzer.white_tissue_gray + 1, 255), WHITE_TISSUE)
+        return classes
+
+    def lut(self) -> np.ndarray:
+        """The 2^24-entry table for the current thresholds, built on first use"""
+        key = self._thresholds_key()
+        table = _LUT_CACHE.get(key)
+        if table is None:
+            with _LUT_LOCK:
+                table = _LUT_CACHE.get(key)
+                if table is None:
+                    table = self._build_lut()
+                    _LUT_CACHE.clear()  # Thresholds changed: the old table is dead weight
+                    _LUT_CACHE[key] = table
+        return table
+
+    def _thresholds_key(self) -> bytes:
+        analyzer = self.analyzer
+        ranges = list(analyzer.red_ranges) + [analyzer.intense_red_range, analyzer.yellow_range,
+                                              analyzer.green_range]
+        grays = [analyzer.necrotic_gray, analyzer.charred_gray, analyzer.white_tissue_gray]
+        return b''.join(np.asarray(bound, np.int32).tobytes() for pair in ranges for bound in pair) + \
+            np.asarray(grays, np.int32).tobytes()
+
+    def _build_lut(self) -> np.ndarray:
+        """Run the reference classifier over every colour, 16 red values at a time"""
+        table = np.empty(1 << 24, np.uint8)
+        blue = np.arange(256, dtype=np.uint8)
+        chunk = np.empty((16, 256, 256, 3), np.uint8)
+        chunk[..., 0] = blue[None, None, :]
+        chunk[..., 1] = blue[None, :, None]
+
+        for red in range(0, 256, 16):
+            chunk[..., 2] = np.arange(red, red + 16, dtype=np.uint8)[:, None, None]
+            classes = self.classify_reference(chunk.reshape(16 * 256, 256, 3))
+            # Index = R << 16 | G << 8 | B, see _classify_lut
+            table[red << 16:(red + 16) << 16] = classes.reshape(-1)
+        return table
+
+    @staticmethod
+    def _classify_lut(img: np.ndarray, table: np.ndarray, allocate: Callable) -> np.ndarray:
+        height, width = img.shape[:2]
+        # Pad to 4 bytes per pixel (alpha = 255) and read each pixel as one
+        # little-endian int32: B | G << 8 | R << 16 | 0xFF << 24, which is the
+        # table index minus 2^24; take() wraps negative indices back onto it
+        bgra = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=allocate((height, width, 4), np.uint8))
+        return np.take(table, bgra.view(np.int32)[..., 0], out=allocate((height, width), np.uint8))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Diagnostics
+Per-request stage instrumentation and process-wide stage histograms.
+
+StageRecorder times each pipeline stage (and, when tracemalloc is on, the
+peak Python/NumPy allocation above the stage's starting point) and collects
+counters such as input dimensions and contour counts; its report becomes the
+optional `diagnostics` block of a result. StageMetrics aggregates those
+reports over the life of a worker into fixed-bucket histograms, which can be
+dumped as JSON or Prometheus text and merged across workers. StageCosts keeps
+a running per-megapixel cost of each stage, which the analyzer uses to plan
+requests that come with a time budget.
+"""
+
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Any, Optional
+
+
+# Histogram upper bounds; a final +Inf bucket is implied
+DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PEAK_BYTES_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(9))  # 64 KiB .. 4 GiB
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Planning cost of the stages after decode, in ms per megapixel of the frame
+# they run on, until requests have been observed (measured on one core)
+DEFAULT_STAGE_COSTS = {
+    'quality': 4.0,
+    'pyramid': 1.6,
+    'detect': 10.0,
+    'classify': 2.5,
+    'infection': 7.0,
+    'infection/no_ring': 2.5,
+    'overlay/full': 5.5,
+    'overlay/thumbnail': 4.0,
+    'overlay/vector': 0.1,
+    'signature': 0.3
+}
+# Stages that run on the working level rather than the full frame
+WORKING_LEVEL_STAGES = ('detect', 'classify', 'infection', 'infection/no_ring')
+
+
+class StageRecorder:
+    """Wall time, peak allocation and counters for one analysis"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, Any] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name` (repeated stages accumulate)"""
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'ms': 0.0})
+            entry['ms'] += (time.perf_counter() - start) * 1000
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1] - base_bytes, 0)
+                entry['peak_bytes'] = max(entry.get('peak_bytes', 0), peak)
+
+    def count(self, name: str, value: Any):
+        self.counters[name] = value
+
+    def report(self) -> Dict[str, Any]:
+        """The `diagnostics` block of a result"""
+        return {
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'stages': {name: {key: round(value, 3) if key == 'ms' else int(value)
+                              for key, value in entry.items()}
+                       for name, entry in self.stages.items()},
+            **self.counters
+        }
+
+
+class NullRecorder:
+    """Recorder that records nothing, for uninstrumented requests"""
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def count(self, name: str, value: Any):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+
+# tracemalloc is process-wide: concurrent traced blocks would reset each
+# other's peaks and stop tracing under one another
+_TRACING_LOCK = threading.Lock()
+
+
+@contextmanager
+def tracing_memory(enabled: bool = True):
+    """
+    Run the block with tracemalloc on, leaving it as found afterwards
+    Traced blocks run one at a time; allocations by untraced threads still
+    count towards their peaks.
+    """
+    if not enabled:
+        yield
+        return
+    with _TRACING_LOCK:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            if started:
+                tracemalloc.stop()
+
+
+def _empty_histogram(bounds) -> Dict[str, Any]:
+    return {'buckets': [0] * (len(bounds) + 1), 'sum': 0.0, 'count': 0}
+
+
+def _observe(histogram: Dict[str, Any], bounds, value: float):
+    index = len(bounds)
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            index = i
+            break
+    histogram['buckets'][index] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def _quantile(histogram: Dict[str, Any], bounds, q: float) -> Optional[float]:
+    """Quantile by linear interpolation inside the bucket, as histogram_quantile() does"""
+    total = histogram['count']
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(histogram['buckets']):
+        if cumulative + count >= rank and count > 0:
+            if i == len(bounds):
+                return float(bounds[-1])  # Past the last bound: report the bound
+            lower = bounds[i - 1] if i > 0 else 0.0
+            return lower + (bounds[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return float(bounds[-1])
+
+
+class StageMetrics:
+    """Process-wide stage histograms and request counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.requests: Dict[str, int] = {}
+        self.durations: Dict[str, Dict[str, Any]] = {}
+        self.peaks: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, recorder: StageRecorder, outcome: str):
+        """Fold one request's recorder into the histograms"""
+        report = recorder.report()
+        with self._lock:
+            self.requests[outcome] = self.requests.get(outcome, 0) + 1
+            stages = dict(report['stages'], total={'ms': report['total_ms']})
+            for name, entry in stages.items():
+                _observe(self.durations.setdefault(name, _empty_histogram(DURATION_BUCKETS_MS)),
+                         DURATION_BUCKETS_MS, entry['ms'])
+                if 'peak_bytes' in entry:
+                    _observe(self.peaks.setdefault(name, _empty_histogram(PEAK_BYTES_BUCKETS)),
+                             PEAK_BYTES_BUCKETS, entry['peak_bytes'])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-safe copy of the raw histograms, for dumping or merging"""
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self._started, 1),
+                'requests': dict(self.requests),
+                'duration_ms': {name: _copy(h) for name, h in self.durations.items()},
+                'peak_bytes': {name: _copy(h) for name, h in self.peaks.items()}
+            }
+
+
+class StageCosts:
+    """
+    Running per-megapixel cost of each stage, for planning under a time budget
+    Each instrumented request moves a stage's rate a `smoothing` fraction of
+    the way toward its observed rate, so the plan tracks the host it runs on.
+    Overlay modes and the infection check without its inflammation ring are
+    costed separately.
+    """
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self.ms_per_megapixel: Dict[str, float] = dict(DEFAULT_STAGE_COSTS)
+
+    def observe(self, recorder: StageRecorder):
+        """Fold one request's stage times into the rates"""
+        counters = recorder.counters
+        if 'height' not in counters:
+            return  # Rejected before decoding, or a cache hit
+        full = counters['height'] * counters['width'] / 1e6
+        working = counters.get('working_height', 0) * counters.get('working_width', 0) / 1e6
+        with self._lock:
+            for name, entry in recorder.stages.items():
+                key = self._key(name, counters)
+                megapixels = working if key in WORKING_LEVEL_STAGES else full
+                if key not in self.ms_per_megapixel or megapixels <= 0:
+                    continue
+                if key == 'pyramid' and working >= full:
+                    continue  # Analyzed at full resolution: no pyramid was built
+                rate = entry['ms'] / megapixels
+                self.ms_per_megapixel[key] += self.smoothing * (rate - self.ms_per_megapixel[key])
+
+    def estimate(self, stage: str, megapixels: float) -> float:
+        """Predicted ms of `stage` (a key of DEFAULT_STAGE_COSTS) on a frame this size"""
+        return self.ms_per_megapixel.get(stage, 0.0) * megapixels
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: round(rate, 3) for name, rate in self.ms_per_megapixel.items()}
+
+    @staticmethod
+    def _key(stage: str, counters: Dict[str, Any]) -> str:
+        if stage == 'overlay':
+            return f"overlay/{counters.get('overlay_mode')}"
+        if stage == 'infection' and counters.get('inflammation_ring') is False:
+            return 'infection/no_ring'
+        return stage
+
+
+def _copy(histogram: Dict[str, Any]) -> Dict[str, Any]:
+    return {'buckets': list(histogram['buckets']), 'sum': histogram['sum'], 'count': histogram['count']}
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum snapshots from several workers (bucket bounds are fixed, so counts add)"""
+    merged = {'uptime_seconds': 0.0, 'requests': {}, 'duration_ms': {}, 'peak_bytes': {}}
+    for snapshot in snapshots:
+        merged['uptime_seconds'] = max(merged['uptime_seconds'], snapshot.get('uptime_seconds', 0.0))
+        for outcome, count in snapshot.get('requests', {}).items():
+            merged['requests'][outcome] = merged['requests'].get(outcome, 0) + count
+        for family, bounds in (('duration_ms', DURATION_BUCKETS_MS), ('peak_bytes', PEAK_BYTES_BUCKETS)):
+            for name, histogram in snapshot.get(family, {}).items():
+                target = merged[family].setdefault(name, _empty_histogram(bounds))
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+                target['sum'] += histogram['sum']
+                target['count'] += histogram['count']
+    return merged
+
+
+def to_json(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Snapshot with bucket bounds and p50/p90/p99 per stage filled in"""
+    result = {
+        'uptime_seconds': snapshot['uptime_seconds'],
+        'requests': snapshot['requests'],
+        'bounds': {'duration_ms': list(DURATION_BUCKETS_MS), 'peak_bytes': list(PEAK_BYTES_BUCKETS)}
+    }
+    for family, bounds in (('duration_ms', DURATION_BUCKETS_MS), ('peak_bytes', PEAK_BYTES_BUCKETS)):
+        result[family] = {}
+        for name, histogram in snapshot[family].items():
+            entry = _copy(histogram)
+            for q in QUANTILES:
+                value = _quantile(histogram, bounds, q)
+                entry[f'p{int(q * 100)}'] = round(value, 3) if value is not None else None
+            result[family][name] = entry
+    return result
+
+
+def to_prometheus(snapshot: Dict[str, Any]) -> str:
+    """Prometheus text exposition of a snapshot (durations in seconds, per convention)"""
+    lines = [
+        '# HELP trauma_eye_requests_total Analysis requests by outcome',
+        '# TYPE trauma_eye_requests_total counter'
+    ]
+    for outcome, count in sorted(snapshot['requests'].items()):
+        lines.append(f'trauma_eye_requests_total{{outcome="{outcome}"}} {count}')
+
+    families = (
+        ('trauma_eye_stage_duration_seconds', 'Wall time per analysis stage',
+         snapshot['duration_ms'], DURATION_BUCKETS_MS, 1000.0),
+        ('trauma_eye_stage_peak_bytes', 'Peak traced allocation per analysis stage',
+         snapshot['peak_bytes'], PEAK_BYTES_BUCKETS, 1.0)
+    )
+    for metric, description, histograms, bounds, divisor in families:
+        if not histograms:
+            continue
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for name in sorted(histograms):
+            histogram = histograms[name]
+            cumulative = 0
+            for bound, count in zip(list(bounds) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                le = bound if bound == '+Inf' else f'{bound / divisor:g}'
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {histogram["sum"] / divisor:g}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
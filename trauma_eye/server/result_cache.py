@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Result Cache
+Content-addressed cache of analysis results, so a capture that reaches the
+server several times (client retries on flaky connections) is only analyzed
+once. Keys combine a hash of the encoded image bytes with the analyzer's
+threshold configuration; entries are stored as JSON text.
+
+Two optional levels:
+- in-memory LRU with an entry/byte budget and TTL, for long-lived workers
+- on-disk directory with a TTL and entry cap, shared across processes in
+  spawn-per-request mode
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class ResultCache:
+    """LRU + TTL cache of analysis results keyed by image content and config"""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 600.0, directory: str = None,
+                 max_disk_entries: int = 1024, memory: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.memory = memory
+
+        # key -> (stored_at, json_text)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, config_fingerprint: str) -> str:
+        """Cache key for one encoded image under one analyzer configuration"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(config_fingerprint.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result for `key` (a fresh copy), or None"""
+        text = self._get_memory(key) if self.memory else None
+        if text is None and self.directory:
+            text = self._get_disk(key)
+            if text is not None and self.memory:
+                self._put_memory(key, text)
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(text)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a result under `key`"""
+        text = json.dumps(result)
+        if self.memory:
+            self._put_memory(key, text)
+        if self.directory:
+            self._put_disk(key, text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, text = entry
+            if self._expired(stored_at):
+                del self._entries[key]
+                self._bytes -= len(text)
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return text
+
+    def _put_memory(self, key: str, text: str):
+        if len(text) > self.max_bytes:
+            return  # Would evict everything else and still not fit
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+
+            self._entries[key] = (time.time(), text)
+            self._bytes += len(text)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                with self._lock:
+                    self.expirations += 1
+                return None
+            with open(path, 'r') as f:
+                text = f.read()
+            # Bump access time so disk eviction is least-recently-used
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return text
+        except OSError:
+            return None
+
+    def _put_disk(self, key: str, text: str):
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, path)  # Atomic, so concurrent readers never see partial files
+        except OSError:
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith('.json')]
+        except OSError:
+            return
+        if len(names) <= self.max_disk_entries:
+            return
+
+        def access_time(path):
+            try:
+                return os.path.getatime(path)
+            except OSError:
+                return 0.0  # Already removed by another process
+
+        # Oldest access first
+        paths = [os.path.join(self.directory, n) for n in names]
+        paths.sort(key=access_time)
+        for path in paths[:len(paths) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+                with self._lock:
+                    self.evictions += 1
+            except OSError:
+                continue
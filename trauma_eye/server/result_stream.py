@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Progressive Results
+Sends an analysis result in slices as the pipeline produces them, so a client
+can show the quality verdict and the risk level before the annotated overlay
+has been drawn and encoded.
+
+Events arrive in pipeline order:
+    quality    {photo_quality}
+    detection  {wound_count, wounds}  (measurements and types; no risk yet)
+    risk       {risk, confidence, message, ..., treatment_recommendations, wounds}
+    overlay    {visual_overlay} or {overlay_geometry}
+    done       every remaining field
+Each event's data is a slice of the final result and later events replace
+earlier keys, so merging them in order gives exactly the document analyze()
+returns. Stages that don't run send nothing (a rejected photo goes straight
+from quality to done, a cache hit sends everything in done).
+"""
+
+from typing import Any, Callable, Dict
+
+
+class ResultStream:
+    """Forwards result slices to `write(event, data)` and tracks what was sent"""
+
+    def __init__(self, write: Callable[[str, Dict[str, Any]], None]):
+        self.write = write
+        self._sent: Dict[str, Any] = {}
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        self._sent.update(data)
+        self.write(event, data)
+
+    def finish(self, result: Dict[str, Any]):
+        """Send the fields of the final result not already sent as they are"""
+        missing = object()
+        remainder = {key: value for key, value in result.items()
+                     if self._sent.get(key, missing) is not value}
+        self._sent.clear()
+        self.write('done', remainder)
+
+
+class NullStream:
+    """Stream that sends nothing, for requests answered in one piece"""
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        pass
+
+    def finish(self, result: Dict[str, Any]):
+        pass
+
+
+NULL_STREAM = NullStream()
@@ -1,20 +1,74 @@
 const express = require('express');
 const cors = require('cors');
-const { spawn } = require('child_process');
-const path = require('path');
 const crypto = require('crypto');
+const { PythonWorkerPool } = require('./workerPool');
 
 const app = express();
 const PORT = process.env.PORT || 5000;
 
+// Warm trauma_eye.py workers, reused across requests
+const analysisPool = new PythonWorkerPool({
+  size: parseInt(process.env.TRAUMA_EYE_WORKERS, 10) || 2,
+  pythonPath: 'python3', // Use 'python3' on Unix systems
+  timeoutMs: 30000,
+  binary: true, // Send raw image bytes instead of base64 JSON
+  // Cache results so client retries of the same photo skip re-analysis; a
+  // shared cache directory lets a retry hit even on a different worker
+  extraArgs: [
+    '--cache',
+    ...(process.env.TRAUMA_EYE_CACHE_DIR ? ['--cache-dir', process.env.TRAUMA_EYE_CACHE_DIR] : []),
+    // Per-wound signature history, so follow-ups only need patient_id + wound_id
+    ...(process.env.TRAUMA_EYE_HISTORY_DB ? ['--history-db', process.env.TRAUMA_EYE_HISTORY_DB] : []),
+    // Threads per worker for large captures, split into bands
+    ...(process.env.TRAUMA_EYE_TILE_THREADS ? ['--tile-threads', process.env.TRAUMA_EYE_TILE_THREADS] : [])
+  ]
+});
+
 // In-memory storage for triage cards
 // Structure: Map<token, { data, expiresAt, createdAt, accessLog }>
 const triageCards = new Map();
 
 // Middleware
 app.use(cors());
+// A burst carries several photos; parsed here, the global parser skips it
+app.use('/api/analyze-wound-burst', express.json({ limit: '60mb' }));
 app.use(express.json({ limit: '10mb' })); // Allow larger payloads for images
 
+// A positive time budget in ms, or null for none
+function budgetMs(value) {
+  const budget = Number(value);
+  return value != null && Number.isFinite(budget) && budget > 0 ? budget : null;
+}
+
+function wantsStream(req) {
+  return req.query.stream === '1' || req.query.stream === 'true' ||
+    (req.get('accept') || '').includes('application/x-ndjson');
+}
+
+/**
+ * Answer with the analysis as NDJSON events, written as the worker sends them
+ * The status is always 200 once streaming has started: analysis errors arrive
+ * in the `done` event (error: true), worker failures as an `error` event.
+ */
+async function streamAnalysis(res, payload) {
+  res.status(200).type('application/x-ndjson');
+  res.flushHeaders();
+  try {
+    await analysisPool.analyze(payload, {
+      onEvent: (event, data) => res.write(JSON.stringify({ event, data }) + '\n')
+    });
+  } catch (poolError) {
+    if (poolError.code !== 'ETIMEDOUT') {
+      console.error('Python worker error:', poolError);
+    }
+    const message = poolError.code === 'ETIMEDOUT'
+      ? 'Analysis timeout. Please try with a smaller image or better lighting.'
+      : 'Analysis service unavailable. Please ensure Python and required dependencies are installed.';
+    res.write(JSON.stringify({ event: 'error', data: { error: true, message } }) + '\n');
+  }
+  res.end();
+}
+
 /**
  * POST /api/analyze-wound
  * Analyzes wound image using Python OpenCV script
@@ -22,12 +76,31 @@ app.use(express.json({ limit: '10mb' })); // Allow larger payloads for images
  * Body:
  * {
  *   "image": "data:image/jpeg;base64,...",
- *   "previous_wound_data": {...} // optional
+ *   "previous_wound_data": {...}, // optional
+ *   "overlay": "full",            // optional: full | thumbnail | vector | none
+ *   "overlay_options": {...},     // optional: { format, quality, max_edge, epsilon }
+ *   "patient_id": "p-123",        // optional, with wound_id
+ *   "wound_id": "left-forearm",   // optional: record in the wound history and
+ *                                 // return `wound_history` (needs TRAUMA_EYE_HISTORY_DB)
+ *   "captured_at": "2024-05-01T09:30:00", // optional, defaults to now
+ *   "diagnostics": true,          // optional: per-stage timings, peak memory,
+ *                                 // dimensions and contour counts in `diagnostics`
+ *   "budget_ms": 400              // optional: time budget; the analysis degrades
+ *                                 // (coarser working level, no inflammation ring,
+ *                                 // smaller or no overlay) to fit it and reports
+ *                                 // what it gave up in `analysis_budget`
  * }
+ *
+ * With ?stream=1 (or Accept: application/x-ndjson) the result is streamed as
+ * NDJSON {"event", "data"} lines as the analysis progresses: quality,
+ * detection, risk, overlay, then done. See streamAnalysis.
  */
 app.post('/api/analyze-wound', async (req, res) => {
   try {
-    const { image, previous_wound_data } = req.body;
+    const {
+      image, previous_wound_data, overlay, overlay_options, patient_id, wound_id, captured_at, diagnostics,
+      budget_ms
+    } = req.body;
 
     // Validate input
     if (!image) {
@@ -48,101 +121,130 @@ app.post('/api/analyze-wound', async (req, res) => {
       });
     }
 
-    // Prepare input for Python script
-    const pythonInput = JSON.stringify({
+    const payload = {
       image,
-      previous_wound_data: previous_wound_data || null
-    });
-
-    // Spawn Python process
-    const pythonPath = 'python3'; // Use 'python3' on Unix systems
-    const scriptPath = path.join(__dirname, 'trauma_eye.py');
-    
-    const pythonProcess = spawn(pythonPath, [scriptPath]);
-
-    let outputData = '';
-    let errorData = '';
-    let isResponseSent = false;
+      previous_wound_data: previous_wound_data || null,
+      overlay: overlay || 'full',
+      overlay_options: overlay_options || null,
+      patient_id: patient_id || null,
+      wound_id: wound_id || null,
+      captured_at: captured_at || null,
+      diagnostics: Boolean(diagnostics),
+      budget_ms: budgetMs(budget_ms)
+    };
+    if (wantsStream(req)) {
+      return streamAnalysis(res, payload);
+    }
 
-    // Set a timeout for the Python process (30 seconds)
-    const processTimeout = setTimeout(() => {
-      if (!isResponseSent) {
-        pythonProcess.kill('SIGKILL');
-        isResponseSent = true;
+    let result;
+    try {
+      result = await analysisPool.analyze(payload);
+    } catch (poolError) {
+      if (poolError.code === 'ETIMEDOUT') {
         return res.status(504).json({
           error: true,
           message: 'Analysis timeout. Please try with a smaller image or better lighting.'
         });
       }
-    }, 30000);
 
-    // Collect stdout
-    pythonProcess.stdout.on('data', (data) => {
-      outputData += data.toString();
-    });
+      console.error('Python worker error:', poolError);
+      return res.status(500).json({
+        error: true,
+        message: 'Analysis service unavailable. Please ensure Python and required dependencies are installed.'
+      });
+    }
+
+    // Check if Python returned an error
+    if (result.error) {
+      return res.status(400).json(result);
+    }
 
-    // Collect stderr
-    pythonProcess.stderr.on('data', (data) => {
-      errorData += data.toString();
+    // Return successful analysis
+    res.json(result);
+
+  } catch (error) {
+    console.error('Server error:', error);
+    res.status(500).json({
+      error: true,
+      message: 'Internal server error',
+      details: process.env.NODE_ENV === 'development' ? error.message : undefined
     });
+  }
+});
 
-    // Handle process completion
-    pythonProcess.on('close', (code) => {
-      clearTimeout(processTimeout);
-      
-      if (isResponseSent) {
-        return; // Already sent timeout response
-      }
-      
-      isResponseSent = true;
-      
-      if (code !== 0) {
-        console.error('Python script error:', errorData);
-        return res.status(500).json({
-          error: true,
-          message: 'Wound analysis failed. Please try again with a clearer image.',
-          details: process.env.NODE_ENV === 'development' ? errorData : undefined
-        });
-      }
+/**
+ * POST /api/analyze-wound-burst
+ * Scores a short burst of photos of one wound on reduced-size previews and
+ * fully analyzes only the best one
+ *
+ * Body: as /api/analyze-wound, with "images" (up to 10 photos) instead of
+ * "image", plus optional "skip_duplicates": true to skip decoding frames
+ * identical to an earlier one. The result carries `burst`: { selected_frame,
+ * frame_count, scoring_ms, frames: [{ frame, width, height, brightness,
+ * sharpness_estimate, quality_estimate: { quality_score, is_acceptable, issues } }
+ * | { frame, duplicate_of } | { frame, error }] }. Streams like
+ * /api/analyze-wound with ?stream=1, where a `burst` event comes first.
+ */
+app.post('/api/analyze-wound-burst', async (req, res) => {
+  try {
+    const {
+      images, previous_wound_data, overlay, overlay_options, patient_id, wound_id, captured_at,
+      diagnostics, skip_duplicates, budget_ms
+    } = req.body;
+
+    if (!Array.isArray(images) || images.length === 0 || !images.every(image => typeof image === 'string')) {
+      return res.status(400).json({
+        error: true,
+        message: 'No image data provided: "images" must be a non-empty array of images'
+      });
+    }
+
+    const largest = Math.max(...images.map(image => Buffer.byteLength(image, 'utf8')));
+    if (largest > 10 * 1024 * 1024) {
+      return res.status(400).json({
+        error: true,
+        message: `Image too large (${(largest / (1024 * 1024)).toFixed(2)}MB). Maximum size is 10MB per frame.`
+      });
+    }
+
+    const payload = {
+      images,
+      previous_wound_data: previous_wound_data || null,
+      overlay: overlay || 'full',
+      overlay_options: overlay_options || null,
+      patient_id: patient_id || null,
+      wound_id: wound_id || null,
+      captured_at: captured_at || null,
+      diagnostics: Boolean(diagnostics),
+      skip_duplicates: Boolean(skip_duplicates),
+      budget_ms: budgetMs(budget_ms)
+    };
+    if (wantsStream(req)) {
+      return streamAnalysis(res, payload);
+    }
 
-      try {
-        // Parse JSON output from Python
-        const result = JSON.parse(outputData);
-        
-        // Check if Python returned an error
-        if (result.error) {
-          return res.status(400).json(result);
-        }
-
-        // Return successful analysis
-        res.json(result);
-      } catch (parseError) {
-        console.error('Failed to parse Python output:', outputData);
-        res.status(500).json({
+    let result;
+    try {
+      result = await analysisPool.analyze(payload);
+    } catch (poolError) {
+      if (poolError.code === 'ETIMEDOUT') {
+        return res.status(504).json({
           error: true,
-          message: 'Failed to process analysis results',
-          details: process.env.NODE_ENV === 'development' ? outputData : undefined
+          message: 'Analysis timeout. Please try with smaller images or better lighting.'
         });
       }
-    });
 
-    // Handle process errors
-    pythonProcess.on('error', (error) => {
-      clearTimeout(processTimeout);
-      
-      if (isResponseSent) return;
-      isResponseSent = true;
-      
-      console.error('Failed to start Python process:', error);
-      res.status(500).json({
+      console.error('Python worker error:', poolError);
+      return res.status(500).json({
         error: true,
         message: 'Analysis service unavailable. Please ensure Python and required dependencies are installed.'
       });
-    });
+    }
 
-    // Send input to Python script via stdin
-    pythonProcess.stdin.write(pythonInput);
-    pythonProcess.stdin.end();
+    if (result.error) {
+      return res.status(400).json(result);
+    }
+    res.json(result);
 
   } catch (error) {
     console.error('Server error:', error);
@@ -154,6 +256,61 @@ app.post('/api/analyze-wound', async (req, res) => {
   }
 });
 
+/**
+ * GET /api/wound-history/:patientId/:woundId
+ * Healing trend over every recorded capture of one wound
+ */
+app.get('/api/wound-history/:patientId/:woundId', async (req, res) => {
+  try {
+    const result = await analysisPool.analyze({
+      op: 'history',
+      patient_id: req.params.patientId,
+      wound_id: req.params.woundId
+    });
+
+    if (result.error) {
+      return res.status(400).json(result);
+    }
+    res.json(result);
+
+  } catch (error) {
+    console.error('Wound history error:', error);
+    res.status(500).json({
+      error: true,
+      message: 'Failed to load wound history'
+    });
+  }
+});
+
+/**
+ * GET /api/metrics?format=prometheus|json
+ * Per-stage latency (and traced memory) histograms merged across all
+ * workers, as Prometheus text (default) or JSON with p50/p90/p99
+ */
+app.get('/api/metrics', async (req, res) => {
+  try {
+    const format = req.query.format === 'json' ? 'json' : 'prometheus';
+    const snapshots = (await analysisPool.broadcast({ op: 'metrics', format: 'raw' }))
+      .filter(snapshot => snapshot && !snapshot.error);
+    const result = await analysisPool.analyze({ op: 'metrics', snapshots, format });
+
+    if (result.error) {
+      return res.status(500).json(result);
+    }
+    if (format === 'prometheus') {
+      return res.type(result.content_type).send(result.text);
+    }
+    res.json(result);
+
+  } catch (error) {
+    console.error('Metrics error:', error);
+    res.status(500).json({
+      error: true,
+      message: 'Failed to collect metrics'
+    });
+  }
+});
+
 // Health check endpoint
 app.get('/api/health', (req, res) => {
   res.json({ status: 'ok', service: 'Trauma Eye API' });
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Synthetic Wound Images
+Reproducible test images for benchmarking: skin-toned backgrounds with
+irregular red lesions, inflamed margins, yellow/green discharge, dark necrotic
+patches, and blur/brightness variations, at camera resolutions from VGA to
+12MP. The same (scenario, resolution, seed) always gives the same pixels.
+
+Usage:
+    python3 synthetic_wounds.py out_dir/ --resolutions vga,fhd --scenarios lesion,discharge
+"""
+
+import os
+import argparse
+import cv2
+import numpy as np
+from typing import Dict, Iterator, List, Tuple
+
+
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    'vga': (640, 480),
+    'hd': (1280, 720),
+    'fhd': (1920, 1080),
+    '5mp': (2592, 1944),
+    '12mp': (4000, 3000)
+}
+
+SCENARIOS = ('lesion', 'discharge', 'necrotic', 'multiple', 'blurred', 'dark', 'bright')
+
+SKIN_BGR = (165, 180, 195)       # Hue ~15, saturation ~40: outside every red range
+WOUND_BGR = (30, 30, 190)
+INFLAMED_BGR = (20, 20, 230)
+DISCHARGE_YELLOW_BGR = (40, 200, 220)
+DISCHARGE_GREEN_BGR = (60, 170, 90)
+NECROTIC_BGR = (15, 15, 25)
+
+
+def _skin(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """Skin-toned background with soft shading and fine sensor noise"""
+    # Low-frequency shading, upsampled from a coarse random grid
+    shading = rng.uniform(0.9, 1.08, (4, 4)).astype(np.float32)
+    shading = cv2.resize(shading, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    img = np.empty((height, width, 3), np.float32)
+    img[:] = SKIN_BGR
+    img *= shading[..., None]
+    img += rng.integers(-10, 11, (height, width, 3)).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def _lesion_polygon(rng: np.random.Generator, center: Tuple[int, int], radius: float,
+                    elongation: float) -> np.ndarray:
+    """Irregular star-shaped outline around `center`"""
+    count = int(rng.integers(12, 28))
+    angles = np.sort(rng.uniform(0, 2 * np.pi, count))
+    radii = radius * rng.uniform(0.6, 1.0, count)
+    rotation = rng.uniform(0, np.pi)
+
+    x = radii * np.cos(angles) * elongation
+    y = radii * np.sin(angles)
+    xr = x * np.cos(rotation) - y * np.sin(rotation) + center[0]
+    yr = x * np.sin(rotation) + y * np.cos(rotation) + center[1]
+    return np.stack([xr, yr], axis=1).round().astype(np.int32)
+
+
+def _draw_lesion(img: np.ndarray, rng: np.random.Generator, center: Tuple[int, int],
+                 radius: float) -> np.ndarray:
+    """Red lesion with an inflamed margin; returns its outline"""
+    # Lacerations are long and thin, abrasions rounder
+    elongation = float(rng.choice([1.0, 1.6, 3.0]))
+    outline = _lesion_polygon(rng, center, radius, elongation)
+
+    margin = max(2, int(radius * 0.12))
+    cv2.polylines(img, [outline], True, INFLAMED_BGR, margin * 2, cv2.LINE_AA)
+    cv2.fillPoly(img, [outline], WOUND_BGR, cv2.LINE_AA)
+    return outline
+
+
+def _patches(img: np.ndarray, rng: np.random.Generator, outline: np.ndarray,
+             color: Tuple[int, int, int], count: int, size: float):
+    """
+    Specks of `color` scattered inside a lesion
+    Kept small enough for the wound mask's closing to absorb, as pus and
+    eschar spots inside a real wound bed are.
+    """
+    x, y, w, h = cv2.boundingRect(outline)
+    inside = np.zeros(img.shape[:2], np.uint8)
+    cv2.fillPoly(inside, [outline], 255)
+
+    for _ in range(count):
+        for _ in range(20):  # Rejection-sample a point inside the outline
+            px = int(rng.integers(x, x + max(w, 1)))
+            py = int(rng.integers(y, y + max(h, 1)))
+            if 0 <= py < img.shape[0] and 0 <= px < img.shape[1] and inside[py, px]:
+                axes = (max(2, int(size * rng.uniform(0.5, 1.0))), max(2, int(size * rng.uniform(0.3, 0.8))))
+                cv2.ellipse(img, (px, py), axes, float(rng.uniform(0, 180)), 0, 360, color, -1, cv2.LINE_AA)
+                break
+
+
+def generate(scenario: str, resolution: str = 'fhd', seed: int = 0) -> np.ndarray:
+    """One synthetic BGR wound photo"""
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario '{scenario}'. Use one of: {', '.join(SCENARIOS)}")
+    width, height = RESOLUTIONS[resolution]
+
+    # Seed from every argument so cases don't share random streams
+    rng = np.random.default_rng([seed, SCENARIOS.index(scenario), width, height])
+    img = _skin(rng, width, height)
+    short_edge = min(width, height)
+
+    lesion_count = int(rng.integers(3, 6)) if scenario == 'multiple' else 1
+    for i in range(lesion_count):
+        radius = short_edge * (rng.uniform(0.06, 0.12) if lesion_count > 1 else rng.uniform(0.12, 0.22))
+        if lesion_count > 1:
+            center = (int((i + 0.5) * width / lesion_count), int(rng.uniform(0.3, 0.7) * height))
+        else:
+            center = (int(rng.uniform(0.35, 0.65) * width), int(rng.uniform(0.35, 0.65) * height))
+        outline = _draw_lesion(img, rng, center, radius)
+
+        speck = short_edge * 0.006
+        if scenario == 'discharge':
+            _patches(img, rng, outline, DISCHARGE_YELLOW_BGR, 80, speck)
+            _patches(img, rng, outline, DISCHARGE_GREEN_BGR, 40, speck)
+        elif scenario == 'necrotic':
+            _patches(img, rng, outline, NECROTIC_BGR, 160, speck)
+
+    if scenario == 'blurred':
+        img = cv2.GaussianBlur(img, (0, 0), short_edge / 250)
+    elif scenario == 'dark':
+        img = cv2.convertScaleAbs(img, alpha=0.3)
+    elif scenario == 'bright':
+        img = cv2.convertScaleAbs(img, alpha=0.6, beta=110)
+
+    return img
+
+
+def encode(img: np.ndarray, quality: int = 92) -> bytes:
+    """JPEG bytes, as a phone camera would upload them"""
+    success, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError('Failed to encode synthetic image')
+    return buffer.tobytes()
+
+
+def generate_suite(resolutions: List[str] = None, scenarios: List[str] = None,
+                   seed: int = 0) -> Iterator[Tuple[str, np.ndarray]]:
+    """Yield ('<resolution>/<scenario>', image) for every combination"""
+    for resolution in resolutions or RESOLUTIONS:
+        for scenario in scenarios or SCENARIOS:
+            yield f'{resolution}/{scenario}', generate(scenario, resolution, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic wound photos to a directory')
+    parser.add_argument('output', help='directory for the generated JPEGs')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help=f"comma-separated subset of: {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for name, img in generate_suite(args.resolutions.split(','), args.scenarios.split(','), args.seed):
+        path = os.path.join(args.output, name.replace('/', '_') + '.jpg')
+        with open(path, 'wb') as f:
+            f.write(encode(img))
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
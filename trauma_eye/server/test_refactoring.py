@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Refactoring Checks
+The fast paths must give exactly what the plain whole-frame path gives on the
+synthetic photos (see synthetic_wounds.py): the per-wound infection check
+bounded to the wounds' box, the banded (tiled) planes, the colour lookup table
+and the calibration sweep's predictions.
+
+Usage:
+    python3 -m pytest test_refactoring.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from trauma_eye import WoundAnalyzer, FrameContext
+from color_classes import ColorClassifier, class_mask, WOUND_RED
+from calibration import (Calibration, extract_profile, apply_config, RISK_LABELS,
+                         INFECTION_LABELS)
+from synthetic_wounds import SCENARIOS, WOUND_BGR, INFLAMED_BGR, generate, encode
+
+
+RESOLUTION = 'hd'  # Over tile_min_pixels, so the tiled path really splits
+
+# Settings the calibration sweep must score as analyze would; saturation and
+# value bounds sit on the profiles' 5-wide bin edges
+CALIBRATION_CONFIGS = [
+    {},
+    {'yellow_range': ((18, 60, 60), (38, 255, 255)), 'intense_red_range': ((0, 100, 150), (6, 255, 255)),
+     'necrotic_gray': 55, 'discharge_ratio': 0.01, 'inflammation_ratio': 0.1},
+    {'green_range': ((45, 40, 40), (85, 249, 249)), 'charred_gray': 70, 'white_tissue_gray': 180,
+     'necrotic_ratio': 0.02, 'burn_charred_ratio': 0.05, 'third_degree_ratio': 0.1}
+]
+
+
+@pytest.fixture(scope='module')
+def photos():
+    """Encoded synthetic photo of every scenario"""
+    return {scenario: encode(generate(scenario, RESOLUTION, seed=1)) for scenario in SCENARIOS}
+
+
+@pytest.fixture(scope='module')
+def images(photos):
+    """The same photos decoded, as analyze sees them"""
+    return {scenario: cv2.imdecode(np.frombuffer(photo, np.uint8), cv2.IMREAD_COLOR)
+            for scenario, photo in photos.items()}
+
+
+@pytest.fixture(scope='module')
+def crowded(images):
+    """The lesion photo with a second wound close enough for their rings to overlap"""
+    img = images['lesion'].copy()
+    ctx = FrameContext(img, WoundAnalyzer())
+    x, y, w, h = cv2.boundingRect(ctx.wound_mask)
+    center = (x + w + 60, y + h // 2)
+    cv2.circle(img, center, 45, INFLAMED_BGR, -1)
+    cv2.circle(img, center, 35, WOUND_BGR, -1)
+    return img
+
+
+def _without_timestamp(result):
+    return {key: value for key, value in result.items() if key != 'timestamp'}
+
+
+def _full_frame_infection_ratios(analyzer, ctx, wound_labels):
+    """
+    Discharge, necrotic and inflammation ratios of each wound from full-frame
+    masks and three dilations; a ring pixel in reach of several wounds goes to
+    the largest (the first in wound_labels)
+    """
+    hsv = cv2.cvtColor(ctx.img, cv2.COLOR_BGR2HSV)
+    gray = cv2.cvtColor(ctx.img, cv2.COLOR_BGR2GRAY)
+    labels = ctx.wound_components[1]
+    discharge = cv2.bitwise_or(cv2.inRange(hsv, *analyzer.yellow_range), cv2.inRange(hsv, *analyzer.green_range))
+    necrotic = cv2.inRange(gray, 0, analyzer.necrotic_gray)
+    intense_red = cv2.inRange(hsv, *analyzer.intense_red_range)
+    kernel = ctx.scaled_kernel(analyzer.inflammation_kernel)
+
+    ratios = []
+    claimed = np.zeros_like(ctx.wound_mask)
+    for label in wound_labels:
+        wound = cv2.compare(labels, int(label), cv2.CMP_EQ)
+        wound_pixels = max(cv2.countNonZero(wound), 1)
+        reach = cv2.dilate(wound, kernel, iterations=3)
+        ring = cv2.bitwise_and(cv2.subtract(reach, ctx.wound_mask), cv2.bitwise_not(claimed))
+        claimed = cv2.bitwise_or(claimed, reach)
+        ratios.append((cv2.countNonZero(cv2.bitwise_and(discharge, wound)) / wound_pixels,
+                       cv2.countNonZero(cv2.bitwise_and(necrotic, wound)) / wound_pixels,
+                       cv2.countNonZero(cv2.bitwise_and(intense_red, ring)) / max(cv2.countNonZero(ring), 1)))
+    return ratios
+
+
+@pytest.mark.parametrize('color_lut', [False, True])
+@pytest.mark.parametrize('intense_red_hue', [None, 30])
+def test_wound_infections_match_full_frame(images, crowded, monkeypatch, color_lut, intense_red_hue):
+    analyzer = WoundAnalyzer(color_lut=color_lut)
+    if intense_red_hue is not None:
+        # Count the skin too, so the ratios depend on exactly where each ring ends
+        analyzer.intense_red_range = (np.array([0, 0, 0]), np.array([intense_red_hue, 255, 255]))
+    # Hand back the ratios themselves rather than the verdict drawn from them
+    monkeypatch.setattr(analyzer, '_infection_verdict', lambda *ratios: ratios)
+    for scenario, img in dict(images, crowded=crowded).items():
+        ctx = FrameContext(img, analyzer)
+        wound_labels, _ = analyzer._rank_wounds(ctx, analyzer._find_wounds(ctx))
+        if scenario in ('multiple', 'crowded'):
+            assert len(wound_labels) > 1
+        # The largest wound alone takes the single-dilation path
+        for subset in (wound_labels, wound_labels[:1]):
+            assert (analyzer._detect_wound_infections(ctx, subset)
+                    == _full_frame_infection_ratios(analyzer, ctx, subset)), (scenario, len(subset))
+
+
+def test_lut_matches_reference_classifier(images):
+    analyzer = WoundAnalyzer()
+    lut = ColorClassifier(analyzer, use_lut=True)
+    reference = ColorClassifier(analyzer)
+    for scenario, img in images.items():
+        classes = reference.classify_reference(img)
+        assert np.array_equal(lut.classify(img), classes), scenario
+        red = reference.red_mask(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+        assert np.array_equal(red, class_mask(classes, WOUND_RED)), scenario
+
+
+def test_lut_analysis_matches_reference(photos):
+    plain, lut = WoundAnalyzer(), WoundAnalyzer(color_lut=True)
+    for scenario, photo in photos.items():
+        assert (_without_timestamp(lut.analyze(photo, overlay='vector'))
+                == _without_timestamp(plain.analyze(photo, overlay='vector'))), scenario
+
+
+def test_tiled_analysis_matches_whole_frame(photos):
+    plain, tiled = WoundAnalyzer(), WoundAnalyzer(tile_threads=3)
+    for scenario, photo in photos.items():
+        assert (_without_timestamp(tiled.analyze(photo, overlay='vector'))
+                == _without_timestamp(plain.analyze(photo, overlay='vector'))), scenario
+
+
+def test_calibration_predicts_analyze(photos):
+    analyzer = WoundAnalyzer()
+    profiles = [extract_profile(analyzer, photo) for photo in photos.values()]
+    labels = [{'risk': None, 'infection_risk': None} for _ in photos]
+    risk, infection = Calibration(analyzer, profiles, labels).predict(CALIBRATION_CONFIGS)
+
+    for column, config in enumerate(CALIBRATION_CONFIGS):
+        configured = WoundAnalyzer()
+        apply_config(configured, config)
+        for row, (scenario, photo) in enumerate(photos.items()):
+            result = configured.analyze(photo, overlay='none')
+            expected_infection = (INFECTION_LABELS.index(result['infection_analysis']['risk_level'])
+                                  if 'infection_analysis' in result else -1)
+            assert risk[row, column] == RISK_LABELS.index(result['risk']), (scenario, config)
+            assert infection[row, column] == expected_infection, (scenario, config)
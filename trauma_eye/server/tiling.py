@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Tiled Execution
+Splits a frame into horizontal bands and runs per-band work on a thread pool.
+OpenCV and NumPy release the GIL inside their kernels, so bands of one large
+capture are processed on several cores at once.
+
+Each band is read with a halo of extra rows on both sides, wide enough that
+every neighbourhood operation in the band (Laplacian, morphology) sees the
+same pixels it would in the whole frame. Results are then cropped back to the
+band's own rows, so merged planes and counts are identical to the untiled
+computation. At the frame's top and bottom the halo is clipped, which gives
+the same border handling as the whole-frame call.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, TypeVar
+
+
+T = TypeVar('T')
+
+
+class Band(NamedTuple):
+    """Rows [y0, y1) of the frame, read as [outer_y0, outer_y1) with halo"""
+    y0: int
+    y1: int
+    outer_y0: int
+    outer_y1: int
+
+    @property
+    def inner(self) -> slice:
+        """The band's own rows, relative to the outer (haloed) rows"""
+        return slice(self.y0 - self.outer_y0, self.y1 - self.outer_y0)
+
+
+class TileRunner:
+    """Thread pool running a function over the haloed bands of a frame"""
+
+    def __init__(self, threads: int, min_band_rows: int = 64):
+        self.threads = threads
+        self.min_band_rows = min_band_rows
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tile')
+
+    def bands(self, height: int, halo: int) -> List[Band]:
+        """Two bands per thread (for load balance), each at least min_band_rows tall"""
+        count = max(1, min(self.threads * 2, height // max(self.min_band_rows, 2 * halo, 1)))
+        edges = [height * i // count for i in range(count + 1)]
+        return [Band(y0, y1, max(y0 - halo, 0), min(y1 + halo, height))
+                for y0, y1 in zip(edges[:-1], edges[1:])]
+
+    def map(self, fn: Callable[[Band], T], height: int, halo: int) -> List[T]:
+        """fn(band) for every band of a `height`-row frame, in band order"""
+        bands = self.bands(height, halo)
+        if len(bands) == 1:
+            return [fn(bands[0])]
+        return list(self._pool.map(fn, bands))
+
+    def close(self):
+        self._pool.shutdown(wait=True)
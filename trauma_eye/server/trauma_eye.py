@@ -6,145 +6,1145 @@ Uses OpenCV and NumPy for computer vision-based wound detection and classificati
 
 import sys
 import json
+import time
 import base64
+import struct
+import hashlib
+import sqlite3
+import argparse
 import cv2
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Tuple, Any
+from functools import cached_property
+from typing import Callable, Dict, List, Tuple, Any, Union, Optional, Iterator
+
+from result_cache import ResultCache
+from wound_history import WoundHistory, encode_mask_rle, summarize_trend
+from color_classes import (ColorClassifier, class_mask, class_count, WOUND_RED, INTENSE_RED,
+                           DISCHARGE, DISCHARGE_YELLOW, DISCHARGE_GREEN, NECROTIC, CHARRED,
+                           WHITE_TISSUE)
+from tiling import TileRunner
+from buffer_pool import BufferPool, BufferLease
+from result_stream import ResultStream, NULL_STREAM
+from diagnostics import (StageRecorder, StageMetrics, StageCosts, NULL_RECORDER, tracing_memory,
+                         merge_snapshots, to_json, to_prometheus)
+
+
+OVERLAY_MODES = ('full', 'thumbnail', 'vector', 'none')
+
+# Overlay image formats: cv2.imencode extension and quality flag, and MIME type
+OVERLAY_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp')
+}
+
+# Risk levels from least to most severe, for picking the worst wound
+RISK_ORDER = ('NONE', 'LOW', 'MODERATE', 'CRITICAL')
+
+# Burn wound types by degree
+BURN_TYPES = (
+    "1st Degree Burn (redness)",
+    "2nd Degree Burn (blisters/white tissue)",
+    "3rd Degree Burn (charred tissue - EMERGENCY)"
+)
+
+# Cheaper settings a time-budgeted analysis takes on in turn (cumulatively)
+# until its predicted cost fits what is left of the budget
+BUDGET_LADDER = (
+    ('working_edge', 800),
+    ('overlay', 'thumbnail'),
+    ('inflammation_ring', False),
+    ('overlay', 'none'),
+    ('working_edge', 400)
+)
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+REDUCED_GRAYSCALE_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+)
+
+
+def read_image_size(buffer: np.ndarray) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from a PNG or JPEG header without decoding pixels
+    Returns None for other formats or malformed headers.
+    """
+    data = buffer.data
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    
+    if data[:2] != b'\xff\xd8':
+        return None
+    
+    # Walk JPEG segments until the start-of-frame header
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1  # Fill byte
+        elif marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        elif 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            i += 2  # Standalone marker without a length
+        else:
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def reduced_grayscale_mode(width: int, height: int, min_edge: int) -> Optional[Tuple[int, int]]:
+    """Largest (factor, imread flag) reduction leaving a long edge of min_edge, or None"""
+    for factor, flag in REDUCED_GRAYSCALE_MODES:
+        if max(width, height) / factor >= min_edge:
+            return factor, flag
+    return None
+
+
+# The 3x3 Laplacian of an 8-bit image lies in [-4 * 255, 4 * 255]
+LAPLACIAN_LIMIT = 1020
+LAPLACIAN_VALUES = np.arange(-LAPLACIAN_LIMIT, LAPLACIAN_LIMIT + 1, dtype=np.int64)
+
+
+def laplacian_variance(gray: np.ndarray, allocate: Callable = np.empty) -> float:
+    """
+    Variance of the Laplacian (the blur measure), from exact integer sums
+    The Laplacian's sum and sum of squares are read off a histogram of its
+    values, so the variance is the correctly rounded value however the pixels
+    are split up or ordered (tiled and whole-frame results agree bit for bit).
+    """
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S, dst=allocate(gray.shape, np.int16))
+    return _variance_from_sums(*_laplacian_sums(laplacian, allocate))
+
+
+def _laplacian_sums(laplacian: np.ndarray, allocate: Callable = np.empty) -> Tuple[int, int, int]:
+    """(sum, sum of squares, count) of a 16-bit Laplacian"""
+    # calcHist returns float32 counts, exact only up to 2^24 per bin
+    rows = max(1, (1 << 24) // max(laplacian.shape[1], 1))
+    counts = np.zeros(len(LAPLACIAN_VALUES), np.int64)
+    scratch = allocate((min(rows, laplacian.shape[0]), laplacian.shape[1]), np.uint16)
+    for y in range(0, laplacian.shape[0], rows):
+        chunk = laplacian[y:y + rows]
+        shifted = cv2.add(chunk, LAPLACIAN_LIMIT, dst=scratch[:len(chunk)], dtype=cv2.CV_16U)
+        counts += cv2.calcHist([shifted], [0], None, [len(LAPLACIAN_VALUES)],
+                               [0, len(LAPLACIAN_VALUES)]).ravel().astype(np.int64)
+    return (int(counts @ LAPLACIAN_VALUES), int(counts @ LAPLACIAN_VALUES ** 2), laplacian.size)
+
+
+def _variance_from_sums(total: int, total_squares: int, count: int) -> float:
+    return (count * total_squares - total * total) / (count * count) if count else 0.0
+
+
+class FrameContext:
+    """
+    Derived planes of one image, shared by every analysis stage
+    Each plane is computed lazily on first access and at most once, so adding
+    a stage never adds another full-frame conversion. `scale` is the size of
+    this image relative to the original capture (1.0 = full resolution).
+    
+    When the analyzer has a TileRunner and the frame is large enough, the
+    quality statistics and the colour/morphology planes are computed in
+    haloed bands on its thread pool; the planes and statistics are identical
+    to the whole-frame ones.
+    """
+    
+    def __init__(self, img: np.ndarray, analyzer: 'WoundAnalyzer', scale: float = 1.0,
+                 buffers: BufferLease = None):
+        self.img = img
+        self.analyzer = analyzer
+        self.scale = scale
+        # Planes are written into arrays from this lease when given, so they
+        # are only valid until the lease is closed
+        self.buffers = buffers
+    
+    def buffer(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """Uninitialised array for a plane of this frame (pooled when leasing)"""
+        if self.buffers is not None:
+            return self.buffers.acquire(shape, dtype)
+        return np.empty(shape, dtype)
+    
+    def discard(self, *planes: str):
+        """Drop cached planes so they are recomputed on next access"""
+        for name in planes:
+            self.__dict__.pop(name, None)
+    
+    def working_level(self, max_edge: int) -> 'FrameContext':
+        """Pyramid level whose long edge fits within max_edge (self if it already fits)"""
+        if not max_edge or max(self.img.shape[:2]) <= max_edge:
+            return self
+        
+        img = self.img
+        while max(img.shape[:2]) > max_edge:
+            height, width = img.shape[:2]
+            img = cv2.pyrDown(img, dst=self.buffer(((height + 1) // 2, (width + 1) // 2, 3), np.uint8))
+        scale = self.scale * img.shape[1] / self.img.shape[1]
+        return FrameContext(img, self.analyzer, scale, self.buffers)
+    
+    def scaled_kernel(self, kernel: np.ndarray) -> np.ndarray:
+        """Square kernel resized for this level, kept odd so it stays centred"""
+        if self.scale == 1.0:
+            return kernel
+        size = max(1, int(round(kernel.shape[0] * self.scale))) | 1
+        return np.ones((size, size), np.uint8)
+    
+    def to_full_resolution(self, contour: np.ndarray) -> np.ndarray:
+        """Map contour points from this level back to original image coordinates"""
+        if self.scale == 1.0:
+            return contour
+        return np.round(contour / self.scale).astype(np.int32)
+    
+    @cached_property
+    def tiled(self) -> bool:
+        """Whether this frame's planes are computed in bands"""
+        analyzer = self.analyzer
+        return (analyzer.tiles is not None
+                and self.img.shape[0] * self.img.shape[1] >= analyzer.tile_min_pixels)
+    
+    @cached_property
+    def gray(self) -> np.ndarray:
+        if self.tiled:
+            return self._tiled_quality[0]
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY, dst=self.buffer(self.img.shape[:2], np.uint8))
+    
+    @cached_property
+    def brightness(self) -> float:
+        """Mean gray level"""
+        if self.tiled:
+            return self._tiled_quality[1]
+        return float(np.mean(self.gray))
+    
+    @cached_property
+    def sharpness(self) -> float:
+        """Laplacian variance of the gray plane"""
+        if self.tiled:
+            return self._tiled_quality[2]
+        return laplacian_variance(self.gray, self.buffer)
+    
+    @cached_property
+    def color_classes(self) -> np.ndarray:
+        """Per-pixel colour class bitmask (see color_classes.py)"""
+        if self.tiled:
+            return self._tiled_segmentation[0]
+        return self.analyzer.color_classifier.classify(self.img, self.buffer)
+    
+    @cached_property
+    def hsv(self) -> np.ndarray:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2HSV, dst=self.buffer(self.img.shape, np.uint8))
+    
+    def color_classes_in(self, window: Tuple[slice, slice]) -> np.ndarray:
+        """
+        Colour classes of a window of the frame
+        Only the window is classified unless the whole plane is already at
+        hand; the direct path reuses whichever of its planes are.
+        """
+        if self.tiled or 'color_classes' in self.__dict__:
+            return self.color_classes[window]
+        classifier = self.analyzer.color_classifier
+        if classifier.use_lut:
+            return classifier.classify(self.img[window], self.buffer)
+        planes = (self.__dict__[name][window] if name in self.__dict__ else None
+                  for name in ('hsv', 'gray', 'red_mask'))
+        return classifier.classify_reference(self.img[window], self.buffer, *planes)
+    
+    @cached_property
+    def red_mask(self) -> np.ndarray:
+        """Raw red-hue mask before morphological cleanup"""
+        if self.tiled:
+            return self._tiled_segmentation[1]
+        if self.analyzer.color_classifier.use_lut:
+            return class_mask(self.color_classes, WOUND_RED, dst=self.buffer(self.img.shape[:2], np.uint8))
+        # Without the table, segmentation only thresholds the red hue bands
+        return self.analyzer.color_classifier.red_mask(self.hsv, self.buffer)
+    
+    @cached_property
+    def wound_mask(self) -> np.ndarray:
+        """Red mask cleaned up with closing then opening"""
+        if self.tiled:
+            return self._tiled_segmentation[2]
+        return self._clean_mask(self.red_mask)
+    
+    @cached_property
+    def wound_pixels(self) -> int:
+        if self.tiled and 'wound_mask' not in self.__dict__:
+            return self._tiled_segmentation[3]
+        return cv2.countNonZero(self.wound_mask)
+    
+    def _clean_mask(self, red_mask: np.ndarray, allocate: Callable = None) -> np.ndarray:
+        allocate = allocate or self.buffer
+        kernel = self.scaled_kernel(self.analyzer.morph_kernel)
+        closed = cv2.morphologyEx(red_mask, cv2.MORPH_CLOSE, kernel,
+                                  dst=allocate(red_mask.shape, np.uint8), iterations=2)
+        return cv2.morphologyEx(closed, cv2.MORPH_OPEN, kernel,
+                                dst=allocate(red_mask.shape, np.uint8), iterations=1)
+    
+    @cached_property
+    def _tiled_quality(self) -> Tuple[np.ndarray, float, float]:
+        """(gray, brightness, sharpness) from bands with a 1-row Laplacian halo"""
+        height, width = self.img.shape[:2]
+        gray = self.buffer((height, width), np.uint8)
+        
+        def run(band):
+            band_gray = cv2.cvtColor(self.img[band.outer_y0:band.outer_y1], cv2.COLOR_BGR2GRAY)
+            gray[band.y0:band.y1] = band_gray[band.inner]
+            laplacian = cv2.Laplacian(band_gray, cv2.CV_16S)[band.inner]
+            return (int(cv2.sumElems(band_gray[band.inner])[0]),) + _laplacian_sums(laplacian)
+        
+        band_sums = self.analyzer.tiles.map(run, height, 1)
+        gray_total, laplacian_total, laplacian_squares, count = (sum(column) for column in zip(*band_sums))
+        return gray, gray_total / count, _variance_from_sums(laplacian_total, laplacian_squares, count)
+    
+    @cached_property
+    def _tiled_segmentation(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        (color_classes, red_mask, wound_mask, wound_pixels) from bands
+        Closing twice then opening once reaches 6 kernel radii from a pixel,
+        so that is the halo.
+        """
+        height, width = self.img.shape[:2]
+        classes = self.buffer((height, width), np.uint8)
+        red_mask = self.buffer((height, width), np.uint8)
+        wound_mask = self.buffer((height, width), np.uint8)
+        classifier = self.analyzer.color_classifier
+        
+        def run(band):
+            band_classes = classifier.classify(self.img[band.outer_y0:band.outer_y1])
+            band_red = class_mask(band_classes, WOUND_RED)
+            band_wound = self._clean_mask(band_red, np.empty)[band.inner]
+            classes[band.y0:band.y1] = band_classes[band.inner]
+            red_mask[band.y0:band.y1] = band_red[band.inner]
+            wound_mask[band.y0:band.y1] = band_wound
+            return cv2.countNonZero(band_wound)
+        
+        halo = 6 * (self.scaled_kernel(self.analyzer.morph_kernel).shape[0] // 2)
+        wound_pixels = sum(self.analyzer.tiles.map(run, height, halo))
+        return classes, red_mask, wound_mask, wound_pixels
+    
+    @cached_property
+    def wound_components(self) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """(count, labels, stats, centroids) of the wound mask's 8-connected regions"""
+        # Grana's block-based labelling is about twice as fast as the default here
+        return cv2.connectedComponentsWithStatsWithAlgorithm(
+            self.wound_mask, 8, cv2.CV_32S, cv2.CCL_GRANA, labels=self.buffer(self.wound_mask.shape, np.int32)
+        )
+
+
+class AnalysisBudget:
+    """
+    Time budget of one analysis and the settings chosen to fit it
+    Without a budget (budget_ms None) the requested settings stand and every
+    stage runs. Otherwise the analyzer plans cheaper settings after decoding
+    and skips optional stages that no longer fit; `degraded` and `skipped`
+    record what it gave up.
+    """
+    
+    def __init__(self, budget_ms: Optional[float], overlay: str, working_edge: Optional[int],
+                 start: float = None):
+        self.budget_ms = budget_ms
+        self.start = time.perf_counter() if start is None else start
+        self.deadline = None if budget_ms is None else self.start + budget_ms / 1000
+        self.overlay = overlay
+        self.working_edge = working_edge
+        self.inflammation_ring = True
+        self.predicted_ms: Optional[float] = None
+        self.degraded: Dict[str, Any] = {}
+        self.skipped: List[str] = []
+    
+    def remaining_ms(self) -> float:
+        if self.deadline is None:
+            return float('inf')
+        return (self.deadline - time.perf_counter()) * 1000
+    
+    def affords(self, ms: float) -> bool:
+        return ms <= self.remaining_ms()
+    
+    def apply(self, setting: str, value: Any):
+        """Take on a cheaper setting, recording it as degraded or skipped"""
+        setattr(self, setting, value)
+        if setting == 'inflammation_ring':
+            self.skip('inflammation_ring')
+        elif setting == 'overlay' and value == 'none':
+            self.degraded.pop('overlay', None)
+            self.skip('overlay')
+        else:
+            self.degraded[setting] = value
+    
+    def skip(self, step: str):
+        self.skipped.append(step)
+    
+    @property
+    def complete(self) -> bool:
+        return not (self.degraded or self.skipped)
+    
+    def report(self) -> Dict[str, Any]:
+        """The `analysis_budget` block of a result"""
+        return {
+            'budget_ms': round(self.budget_ms, 1),
+            'predicted_ms': None if self.predicted_ms is None else round(self.predicted_ms, 1),
+            'elapsed_ms': round((time.perf_counter() - self.start) * 1000, 1),
+            'complete': self.complete,
+            'degraded': self.degraded,
+            'skipped': self.skipped
+        }
 
 
 class WoundAnalyzer:
     """Main class for analyzing wound images"""
     
-    def __init__(self):
+    def __init__(self, max_working_edge: Optional[int] = None, cache: ResultCache = None,
+                 history: WoundHistory = None, metrics: StageMetrics = None, color_lut: bool = False,
+                 tile_threads: int = 0, buffer_pool: BufferPool = None):
         self.min_resolution = (400, 400)
         self.min_brightness = 40
         self.max_brightness = 240
         self.blur_threshold = 100.0
         self.pixel_to_cm = 100  # Rough estimate: 100 pixels ≈ 1cm
+        self.min_wound_area = 500
+        
+        # Pre-decode quality gate: a reduced-decode estimate only counts when
+        # it is this far past its threshold, so the gate never rejects a photo
+        # the full-resolution check would accept
+        self.gate_brightness_margin = 10
+        self.gate_blur_ratio = 0.5
+        self.gate_min_edge = 128  # smallest long edge worth a reduced decode
+        
+        # Burst capture: frames are ranked on a reduced decode with at least
+        # this long edge, and only the best one is analyzed
+        self.burst_max_frames = 10
+        self.burst_preview_edge = 256
+        
+        # Segmentation and infection scoring run on a pyramid level whose long
+        # edge is at most this many pixels (None = always full resolution).
+        # Coarser contours shift the measured area and the shape-based wound
+        # types, so this trades accuracy for speed and is off by default
+        self.max_working_edge = max_working_edge
+        
+        # HSV bounds (two ranges for red in HSV)
+        self.red_ranges = [
+            (np.array([0, 50, 50]), np.array([10, 255, 255])),
+            (np.array([170, 50, 50]), np.array([180, 255, 255]))
+        ]
+        self.yellow_range = (np.array([20, 50, 50]), np.array([40, 255, 255]))
+        self.green_range = (np.array([40, 50, 50]), np.array([80, 255, 255]))
+        self.intense_red_range = (np.array([0, 100, 100]), np.array([10, 255, 255]))
+        
+        # Gray cut-offs: necrotic <= necrotic_gray, charred < charred_gray,
+        # white tissue > white_tissue_gray
+        self.necrotic_gray = 40
+        self.charred_gray = 50
+        self.white_tissue_gray = 200
+        
+        # Infection signs: share of the wound (of its ring, for inflammation)
+        # a colour class must exceed
+        self.discharge_ratio = 0.05
+        self.necrotic_ratio = 0.1
+        self.inflammation_ratio = 0.3
+        
+        # Burn signs: share of the wound's box that is charred or white
+        self.burn_charred_ratio = 0.15
+        self.burn_white_ratio = 0.2
+        self.third_degree_ratio = 0.3
+        self.second_degree_ratio = 0.3
+        
+        # Frames of at least tile_min_pixels are split into bands for
+        # tile_threads threads (0 or 1 = whole-frame, single call per stage)
+        self.tile_min_pixels = 500_000
+        self.tiles = TileRunner(tile_threads) if tile_threads > 1 else None
+        
+        # Per-pixel colour classes under the ranges above; with color_lut the
+        # classes come from a 16 MiB lookup table over all BGR colours, built
+        # once per process (worth it only for long-lived analyzers)
+        self.color_classifier = ColorClassifier(self, use_lut=color_lut)
+        
+        # Morphological kernels
+        self.morph_kernel = np.ones((5, 5), np.uint8)
+        self.inflammation_kernel = np.ones((15, 15), np.uint8)
+        
+        # Overlay defaults, overridable per request via `overlay_options`
+        self.overlay_options = {
+            'format': 'jpeg',       # 'jpeg' or 'webp'
+            'quality': 95,          # encoder quality (0-100)
+            'max_edge': 480,        # long edge of 'thumbnail' overlays
+            'epsilon': 0.0          # polyline simplification tolerance for 'vector' (pixels)
+        }
+        
+        # Optional result cache for repeat submissions of the same capture
+        self.cache = cache
+        
+        # Optional per-wound signature store for trends across captures
+        self.history = history
+        
+        # Optional process-wide stage histograms (long-lived workers)
+        self.metrics = metrics
+        # Per-megapixel stage costs, learned from instrumented requests, for
+        # planning requests with a time budget
+        self.stage_costs = StageCosts()
+        # Diagnostics requests trace peak allocation per stage. tracemalloc
+        # counts every thread, so turn this off where analyses run concurrently
+        self.trace_memory = True
+        
+        # Optional pool of full-frame intermediates reused across requests
+        self.buffer_pool = buffer_pool
+    
+    def config_fingerprint(self) -> str:
+        """Stable digest of every setting that can change an analysis result"""
+        config = {
+            'min_resolution': self.min_resolution,
+            'min_brightness': self.min_brightness,
+            'max_brightness': self.max_brightness,
+            'blur_threshold': self.blur_threshold,
+            'pixel_to_cm': self.pixel_to_cm,
+            'min_wound_area': self.min_wound_area,
+            'gate': [self.gate_brightness_margin, self.gate_blur_ratio, self.gate_min_edge],
+            'max_working_edge': self.max_working_edge,
+            'red_ranges': [[r.tolist() for r in pair] for pair in self.red_ranges],
+            'yellow_range': [r.tolist() for r in self.yellow_range],
+            'green_range': [r.tolist() for r in self.green_range],
+            'intense_red_range': [r.tolist() for r in self.intense_red_range],
+            'gray': [self.necrotic_gray, self.charred_gray, self.white_tissue_gray],
+            'infection_ratios': [self.discharge_ratio, self.necrotic_ratio, self.inflammation_ratio],
+            'burn_ratios': [self.burn_charred_ratio, self.burn_white_ratio,
+                            self.third_degree_ratio, self.second_degree_ratio],
+            'kernels': [self.morph_kernel.shape, self.inflammation_kernel.shape]
+        }
+        return json.dumps(config, sort_keys=True)
+    
+    def wound_trend(self, patient_id: str, wound_id: str) -> Dict[str, Any]:
+        """Healing trend of a tracked wound, without a new capture"""
+        if self.history is None:
+            return self._error_response("Wound history is not enabled on this analyzer")
+        return self.history.trend(patient_id, wound_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters for a long-lived analyzer"""
+        return {
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'buffer_pool': self.buffer_pool.stats() if self.buffer_pool is not None else None
+        }
+    
+    def metrics_snapshot(self) -> Optional[Dict[str, Any]]:
+        """Raw stage histograms collected so far (None without metrics)"""
+        return self.metrics.snapshot() if self.metrics is not None else None
+    
+    def warm_up(self):
+        """
+        Run one throwaway analysis so OpenCV's lazy initialisation (and the
+        colour lookup table, with color_lut) is paid up front
+        """
+        img = np.full((self.min_resolution[0], self.min_resolution[1], 3), 128, np.uint8)
+        cv2.circle(img, (200, 200), 60, (0, 0, 200), -1)
+        
+        # Keep the throwaway result out of the cache, metrics and their counters
+        cache, metrics = self.cache, self.metrics
+        self.cache = self.metrics = None
+        try:
+            self.analyze(self._encode_image(img))
+        finally:
+            self.cache, self.metrics = cache, metrics
     
-    def analyze(self, image_data: str, previous_wound_data: Dict = None) -> Dict[str, Any]:
+    def analyze(self, image_data: Union[str, bytes], previous_wound_data: Dict = None,
+                overlay: str = 'full', overlay_options: Dict = None, wound_id: str = None,
+                patient_id: str = '', captured_at: str = None, diagnostics: bool = False,
+                stream: ResultStream = None, budget_ms: float = None) -> Dict[str, Any]:
         """
         Main analysis pipeline
         Args:
-            image_data: Base64 encoded image string
+            image_data: Base64 encoded image string, or raw encoded image bytes
             previous_wound_data: Previous wound analysis for comparison
+            overlay: 'full' or 'thumbnail' (annotated `visual_overlay` image),
+                'vector' (`overlay_geometry` coordinates for the client to draw)
+                or 'none'
+            overlay_options: Overrides for self.overlay_options
+            wound_id: With a history store, record this capture under
+                (patient_id, wound_id) and report the trend over its series
+            patient_id: Patient the wound belongs to
+            captured_at: ISO 8601 timestamp of the capture (default: now);
+                without an offset it is taken as local time
+            diagnostics: Add a `diagnostics` block with per-stage wall time,
+                peak traced allocation (with self.trace_memory), input
+                dimensions and contour counts
+            stream: Receives slices of the result as stages complete (see
+                result_stream); the caller sends the rest with stream.finish()
+            budget_ms: Time budget for this call. The analyzer then plans a
+                coarser working level, no inflammation ring or a smaller (or
+                no) overlay from its learned stage costs, skips optional
+                stages that no longer fit, and reports what it gave up in an
+                `analysis_budget` block
         Returns:
             Complete analysis results dictionary
         """
+        start = time.perf_counter()
+        # Budgeted requests are always timed, so the stage costs stay current
+        instrumented = diagnostics or self.metrics is not None or budget_ms is not None
+        traced = diagnostics and self.trace_memory
+        recorder = StageRecorder(trace_memory=traced) if instrumented else NULL_RECORDER
+        
+        # Allocation tracing slows analysis noticeably, so only when asked
+        with tracing_memory(traced):
+            result = self._analyze(image_data, previous_wound_data, overlay, overlay_options,
+                                   wound_id, patient_id, captured_at, recorder, stream or NULL_STREAM,
+                                   budget_ms, start)
+        
+        if instrumented:
+            if not traced:
+                self.stage_costs.observe(recorder)  # Traced stages run slow
+            outcome = self._outcome(result, recorder)
+            if self.metrics is not None:
+                self.metrics.observe(recorder, outcome)
+            if diagnostics:
+                result['diagnostics'] = dict(recorder.report(), outcome=outcome)
+        return result
+    
+    def analyze_burst(self, images: List[Union[str, bytes]], previous_wound_data: Dict = None,
+                      skip_duplicates: bool = False, **options) -> Dict[str, Any]:
+        """
+        Analyze the best frame of a short burst of captures of one wound
+        Each frame's exposure and sharpness are scored on a reduced-size
+        grayscale decode, and only the best frame goes through analyze() (which
+        takes the remaining keyword arguments). With skip_duplicates, frames
+        whose bytes repeat an earlier frame (resent by the camera) are not
+        decoded again. Frames that merely look alike are still scored: motion
+        blur hardly changes a preview, so comparing content would throw away
+        the sharp frame as often as the blurred one.
+        Returns the chosen frame's analysis with a `burst` block naming the
+        selected frame and listing every frame's preview scores.
+        """
+        if not images:
+            return self._error_response("No image data provided")
+        if len(images) > self.burst_max_frames:
+            return self._error_response(
+                f"Burst too long ({len(images)} frames). Maximum: {self.burst_max_frames}"
+            )
+        
+        start = time.perf_counter()
+        seen = {} if skip_duplicates else None
+        frames = [self._score_burst_frame(index, image_data, seen)
+                  for index, image_data in enumerate(images)]
+        scored = [frame for frame in frames if 'quality_estimate' in frame]
+        burst = {
+            'selected_frame': None,
+            'frame_count': len(images),
+            'frames': frames,
+            'scoring_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+        if not scored:
+            return dict(self._error_response("Failed to decode any frame of the burst"), burst=burst)
+        
+        # Frames not clearly unacceptable come first, then the sharpest preview:
+        # the estimate sees exposure but hardly any blur, so its score alone
+        # would put a blurred frame ahead of a sharp one with an exposure issue
+        best = max(scored, key=lambda frame: (frame['quality_estimate']['is_acceptable'],
+                                              frame['sharpness_estimate'],
+                                              frame['quality_estimate']['quality_score']))
+        burst['selected_frame'] = best['frame']
+        # The choice is known before the analysis starts
+        (options.get('stream') or NULL_STREAM).emit('burst', {'burst': burst})
+        result = self.analyze(images[best['frame']], previous_wound_data, **options)
+        result['burst'] = burst
+        return result
+    
+    def _score_burst_frame(self, index: int, image_data: Union[str, bytes],
+                           seen: Optional[Dict[bytes, int]]) -> Dict[str, Any]:
+        """
+        Preview quality of one burst frame
+        `seen` maps the digest of each earlier frame to its index when
+        duplicates are skipped, None otherwise.
+        """
+        buffer = self._image_buffer(image_data)
+        if buffer is None:
+            return {'frame': index, 'error': 'Failed to decode image'}
+        
+        if seen is not None:
+            digest = hashlib.sha256(buffer).digest()
+            if digest in seen:
+                return {'frame': index, 'duplicate_of': seen[digest]}
+            seen[digest] = index
+        
+        preview = self._burst_preview(buffer)
+        if preview is None:
+            return {'frame': index, 'error': 'Failed to decode image'}
+        small, factor, width, height = preview
+        
+        # Downsampling raises the Laplacian variance of blurred content, so the
+        # preview's own value only ranks frames of the burst against each
+        # other, and the thresholds are applied as the pre-decode gate does
+        report = self._preview_quality(small, factor, width, height)
+        return {
+            'frame': index,
+            'width': width,
+            'height': height,
+            'brightness': round(report['brightness'], 2),
+            'sharpness_estimate': round(report['sharpness'], 2),
+            'quality_estimate': {
+                'quality_score': report['quality_score'],
+                'is_acceptable': report['is_acceptable'],
+                'issues': report['issues']
+            }
+        }
+    
+    def _burst_preview(self, buffer: np.ndarray) -> Optional[Tuple[np.ndarray, int, int, int]]:
+        """(gray preview, reduction factor, width, height) of an encoded frame"""
+        size = read_image_size(buffer)
+        mode = reduced_grayscale_mode(*size, self.burst_preview_edge) if size else None
+        factor, flag = mode or (1, cv2.IMREAD_GRAYSCALE)
+        
+        small = cv2.imdecode(buffer, flag)
+        if small is None:
+            return None
+        if size is None:
+            return small, factor, small.shape[1], small.shape[0]
+        
+        # The decoder applies EXIF orientation; follow it for the resolution check
+        width, height = size
+        if (small.shape[0] > small.shape[1]) != (height > width):
+            width, height = height, width
+        return small, factor, width, height
+    
+    def _analyze(self, image_data: Union[str, bytes], previous_wound_data: Optional[Dict], overlay: str,
+                 overlay_options: Optional[Dict], wound_id: Optional[str], patient_id: str,
+                 captured_at: Optional[str], recorder, stream: ResultStream,
+                 budget_ms: Optional[float], start: float) -> Dict[str, Any]:
+        """analyze() without the instrumentation bookkeeping"""
         try:
-            # Decode image
-            img = self._decode_image(image_data)
-            if img is None:
-                return self._error_response("Failed to decode image")
-            
-            # Check photo quality
-            quality_result = self._check_photo_quality(img)
-            if not quality_result['is_acceptable']:
-                return {
-                    'risk': 'UNKNOWN',
-                    'confidence': 0.0,
-                    'message': 'Photo quality is insufficient for analysis. Please retake the photo.',
-                    'photo_quality': quality_result,
-                    'timestamp': datetime.now().isoformat()
-                }
-            
-            # Detect wounds
-            wound_mask, contours = self._detect_wounds(img)
+            if overlay not in OVERLAY_MODES:
+                return self._error_response(
+                    f"Unknown overlay mode '{overlay}'. Use one of: {', '.join(OVERLAY_MODES)}"
+                )
+            if budget_ms is not None:
+                try:
+                    budget_ms = float(budget_ms)
+                except (TypeError, ValueError):
+                    budget_ms = float('nan')
+                if not 0 <= budget_ms < float('inf'):  # NaN fails both
+                    return self._error_response("Invalid budget_ms. Use a number of milliseconds (0 or more)")
+            budget = AnalysisBudget(budget_ms, overlay, self.max_working_edge, start)
+            if overlay_options is not None and not isinstance(overlay_options, dict):
+                return self._error_response("Invalid overlay_options. Use an object")
+            overlay_options = {**self.overlay_options, **(overlay_options or {})}
+            options_error = self._overlay_options_error(overlay_options)
+            if options_error:
+                return self._error_response(f"Invalid overlay_options: {options_error}")
             
-            if len(contours) == 0:
-                return {
-                    'risk': 'NONE',
-                    'confidence': 0.0,
-                    'message': 'No wound detected in the image. Please ensure the wound is clearly visible.',
-                    'photo_quality': quality_result,
-                    'timestamp': datetime.now().isoformat()
-                }
-            
-            # Get largest wound contour
-            largest_contour = max(contours, key=cv2.contourArea)
-            
-            # Measure wound
-            measurements = self._measure_wound(largest_contour)
-            
-            # Classify wound type
-            wound_types = self._classify_wound(img, wound_mask, largest_contour)
+            buffer = self._image_buffer(image_data)
+            if buffer is None:
+                return self._error_response("Failed to decode image")
+            recorder.count('input_bytes', int(buffer.size))
             
-            # Check for infection
-            infection_analysis = self._detect_infection(img, wound_mask)
+            tracked = wound_id is not None and self.history is not None
             
-            # Generate annotated image
-            annotated_img = self._draw_annotations(img.copy(), contours)
-            annotated_base64 = self._encode_image(annotated_img)
+            # Same capture, same settings: reuse the earlier result
+            cache_key = None
+            result = None
+            if self.cache is not None:
+                fingerprint = self.config_fingerprint() + json.dumps([overlay, overlay_options, tracked],
+                                                                     sort_keys=True)
+                with recorder.stage('cache_lookup'):
+                    cache_key = ResultCache.make_key(buffer, fingerprint)
+                    result = self.cache.get(cache_key)
+                if result is not None:
+                    result['timestamp'] = datetime.now().isoformat()
+                    recorder.count('cache_hit', True)
             
-            # Determine risk level
-            risk_level, confidence = self._calculate_risk(
-                measurements, wound_types, infection_analysis
-            )
-            
-            # Generate treatment recommendations
-            treatment = self._generate_treatment(
-                risk_level, wound_types, infection_analysis, measurements
-            )
+            if result is None:
+                result = self._analyze_buffer(buffer, overlay, overlay_options, signature=tracked,
+                                              recorder=recorder, stream=stream, budget=budget)
+                # A result cut short by its budget mustn't stand in for a full one
+                if cache_key is not None and not result.get('error') and budget.complete:
+                    self.cache.put(cache_key, result)
+            if budget.budget_ms is not None:
+                result['analysis_budget'] = budget.report()
             
-            # Compare with previous wound if available
-            comparison = None
-            if previous_wound_data:
-                comparison = self._compare_wounds(measurements, previous_wound_data)
+            signature = result.pop('wound_signature', None)
+            result = self._with_comparison(result, previous_wound_data)
+            if tracked:
+                with recorder.stage('history'):
+                    result = self._with_history(result, buffer, signature, patient_id, wound_id, captured_at)
+            return result
             
+        except Exception as e:
+            return self._error_response(f"Analysis error: {str(e)}")
+    
+    def _analyze_buffer(self, buffer: np.ndarray, overlay: str, overlay_options: Dict[str, Any],
+                        signature: bool = False, recorder=NULL_RECORDER,
+                        stream=NULL_STREAM, budget: AnalysisBudget = None) -> Dict[str, Any]:
+        """
+        Analysis of one encoded image, without the comparison to a previous capture
+        With `signature`, the largest wound's history signature is added under
+        'wound_signature' for the caller to take out. Stages are timed on
+        `recorder`, partial results go to `stream` as they are known, and
+        `budget` bounds the time spent.
+        """
+        if budget is None:
+            budget = AnalysisBudget(None, overlay, self.max_working_edge)
+        if self.buffer_pool is None:
+            return self._analyze_stages(buffer, overlay_options, signature, recorder, None, stream, budget)
+        # Intermediates go back to the pool once the (plain JSON) result is built
+        with self.buffer_pool.lease() as buffers:
+            return self._analyze_stages(buffer, overlay_options, signature, recorder, buffers, stream,
+                                        budget)
+    
+    def _analyze_stages(self, buffer: np.ndarray, overlay_options: Dict[str, Any], signature: bool,
+                        recorder, buffers: Optional[BufferLease], stream,
+                        budget: AnalysisBudget) -> Dict[str, Any]:
+        # Reject hopeless photos before paying for a full decode
+        with recorder.stage('gate'):
+            gate_result = self._fast_quality_gate(buffer)
+        if gate_result is not None:
+            stream.emit('quality', {'photo_quality': gate_result})
+            return self._quality_rejection(gate_result)
+        
+        # Decode image
+        with recorder.stage('decode'):
+            img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if img is None:
+            return self._error_response("Failed to decode image")
+        recorder.count('height', img.shape[0])
+        recorder.count('width', img.shape[1])
+        
+        ctx = FrameContext(img, self, buffers=buffers)
+        
+        # Check photo quality
+        with recorder.stage('quality'):
+            quality_result = self._check_photo_quality(ctx)
+        stream.emit('quality', {'photo_quality': quality_result})
+        if not quality_result['is_acceptable']:
+            return self._quality_rejection(quality_result)
+        
+        self._plan_budget(budget, img.shape[1], img.shape[0], signature)
+        
+        # Detect wounds on a bounded working resolution; building the pyramid
+        # costs in proportion to the full frame, segmenting it to the level
+        with recorder.stage('pyramid'):
+            work_ctx = ctx.working_level(budget.working_edge)
+        with recorder.stage('detect'):
+            regions = self._find_wounds(work_ctx)
+        recorder.count('working_height', work_ctx.img.shape[0])
+        recorder.count('working_width', work_ctx.img.shape[1])
+        recorder.count('contours', len(regions))
+        
+        if len(regions) == 0:
             return {
-                'risk': risk_level,
-                'confidence': confidence,
-                'visual_overlay': annotated_base64,
-                'message': self._generate_message(risk_level, wound_types),
-                'wound_types': wound_types,
-                'infection_analysis': infection_analysis,
-                'measurements': measurements,
-                'treatment_recommendations': treatment,
+                'risk': 'NONE',
+                'confidence': 0.0,
+                'message': 'No wound detected in the image. Please ensure the wound is clearly visible.',
                 'photo_quality': quality_result,
-                'wound_comparison': comparison,
                 'timestamp': datetime.now().isoformat()
             }
+        
+        labels, contours = self._rank_wounds(work_ctx, regions)
+        
+        with recorder.stage('classify'):
+            # Measure and classify every wound
+            measurements_list = [self._measure_wound(c) for c in contours]
+            wound_types_list = [self._classify_wound(ctx, c) for c in contours]
+        
+        centroids = []
+        for label in labels:
+            cx, cy = work_ctx.wound_components[3][label] / work_ctx.scale
+            centroids.append({'x': int(round(cx)), 'y': int(round(cy))})
+        stream.emit('detection', {
+            'wound_count': len(labels),
+            'wounds': [{'id': index + 1, 'wound_types': wound_types_list[index],
+                        'measurements': measurements_list[index], 'centroid': centroids[index]}
+                       for index in range(len(labels))]
+        })
+        
+        # Check each wound for infection, if there's still time
+        working_megapixels = work_ctx.img.shape[0] * work_ctx.img.shape[1] / 1e6
+        infection_stage = 'infection' if budget.inflammation_ring else 'infection/no_ring'
+        if budget.affords(self.stage_costs.estimate(infection_stage, working_megapixels)):
+            recorder.count('inflammation_ring', budget.inflammation_ring)
+            with recorder.stage('infection'):
+                infection_list = self._detect_wound_infections(work_ctx, labels, budget.inflammation_ring)
+        else:
+            budget.skip('infection')
+            infection_list = [self._infection_not_assessed() for _ in labels]
+        
+        with recorder.stage('risk'):
+            # Determine each wound's risk level
+            wounds = []
+            for index in range(len(labels)):
+                risk_level, confidence = self._calculate_risk(
+                    measurements_list[index], wound_types_list[index], infection_list[index]
+                )
+                wounds.append({
+                    'id': index + 1,
+                    'risk': risk_level,
+                    'confidence': confidence,
+                    'wound_types': wound_types_list[index],
+                    'infection_analysis': infection_list[index],
+                    'measurements': measurements_list[index],
+                    'centroid': centroids[index]
+                })
             
-        except Exception as e:
-            return self._error_response(f"Analysis error: {str(e)}")
+            # The verdict describes the most severe wound (largest on ties);
+            # measurements stay on the largest, so comparisons with earlier
+            # captures follow the same wound whichever one is worst
+            primary = max(wounds, key=lambda wound: (RISK_ORDER.index(wound['risk']), -wound['id']))
+            risk_level, confidence = primary['risk'], primary['confidence']
+            wound_types = primary['wound_types']
+            infection_analysis = primary['infection_analysis']
+            measurements = measurements_list[0]
+            
+            # Generate treatment recommendations
+            treatment = self._generate_treatment(
+                risk_level, wound_types, infection_analysis, primary['measurements']
+            )
+        message = self._generate_message(risk_level, wound_types)
+        stream.emit('risk', {
+            'risk': risk_level,
+            'confidence': confidence,
+            'message': message,
+            'wound_types': wound_types,
+            'infection_analysis': infection_analysis,
+            'measurements': measurements,
+            'treatment_recommendations': treatment,
+            'primary_wound_id': primary['id'],
+            'wounds': wounds
+        })
+        
+        # The overlay comes last: drawing and encoding it is the slowest step
+        # and the verdict above doesn't depend on it
+        self._fit_overlay(budget, img.shape[1] * img.shape[0] / 1e6)
+        recorder.count('overlay_mode', budget.overlay)
+        with recorder.stage('overlay'):
+            overlay_fields = self._render_overlay(img, contours, budget.overlay, overlay_options, ctx.buffer)
+        if overlay_fields:
+            stream.emit('overlay', overlay_fields)
+        
+        result = {
+            'risk': risk_level,
+            'confidence': confidence,
+            **overlay_fields,
+            'message': message,
+            'wound_types': wound_types,
+            'infection_analysis': infection_analysis,
+            'measurements': measurements,
+            'treatment_recommendations': treatment,
+            'photo_quality': quality_result,
+            'wound_count': len(wounds),
+            'primary_wound_id': primary['id'],
+            'wounds': wounds,
+            'wound_comparison': None,
+            'timestamp': datetime.now().isoformat()
+        }
+        if signature:
+            with recorder.stage('signature'):
+                result['wound_signature'] = self._wound_signature(ctx, contours[0], measurements)
+        return result
+    
+    def _plan_budget(self, budget: AnalysisBudget, width: int, height: int, signature: bool):
+        """
+        Take on settings from BUDGET_LADDER, in order, until the predicted cost
+        of the stages after the quality check fits the rest of the budget
+        """
+        if budget.budget_ms is None:
+            return
+        long_edge = max(width, height)
+        predicted = self._predict_ms(budget, width, height, signature)
+        for setting, value in BUDGET_LADDER:
+            if budget.affords(predicted):
+                break
+            current = getattr(budget, setting)
+            if setting == 'working_edge':
+                cheaper = value < min(current or long_edge, long_edge)
+            elif setting == 'overlay':
+                cheaper = current in (('full',) if value == 'thumbnail' else ('full', 'thumbnail'))
+            else:
+                cheaper = current != value
+            if cheaper:
+                budget.apply(setting, value)
+                predicted = self._predict_ms(budget, width, height, signature)
+        budget.predicted_ms = (time.perf_counter() - budget.start) * 1000 + predicted
+    
+    def _predict_ms(self, budget: AnalysisBudget, width: int, height: int, signature: bool) -> float:
+        """Predicted ms from detection to the end under the budget's settings"""
+        costs = self.stage_costs
+        megapixels = width * height / 1e6
+        
+        # Each pyramid level halves both sides, as in FrameContext.working_level
+        working_megapixels = megapixels
+        long_edge = max(width, height)
+        while budget.working_edge and long_edge > budget.working_edge:
+            long_edge = (long_edge + 1) // 2
+            working_megapixels /= 4
+        
+        ms = costs.estimate('pyramid', megapixels) if working_megapixels < megapixels else 0.0
+        ms += costs.estimate('detect', working_megapixels) + costs.estimate('classify', working_megapixels)
+        ms += costs.estimate('infection' if budget.inflammation_ring else 'infection/no_ring',
+                             working_megapixels)
+        if budget.overlay != 'none':
+            ms += costs.estimate(f'overlay/{budget.overlay}', megapixels)
+        if signature:
+            ms += costs.estimate('signature', megapixels)
+        return ms
+    
+    def _fit_overlay(self, budget: AnalysisBudget, megapixels: float):
+        """Fall back to a thumbnail, then to no overlay, if the planned one no longer fits"""
+        if budget.budget_ms is None:
+            return
+        for mode, fallback in (('full', 'thumbnail'), ('thumbnail', 'none')):
+            if budget.overlay == mode and not budget.affords(self.stage_costs.estimate(f'overlay/{mode}',
+                                                                                       megapixels)):
+                budget.apply('overlay', fallback)
+    
+    def _outcome(self, result: Dict[str, Any], recorder) -> str:
+        """Request outcome label for metrics"""
+        if result.get('error'):
+            return 'error'
+        if recorder.counters.get('cache_hit'):
+            return 'cache_hit'
+        if not (result.get('photo_quality') or {}).get('is_acceptable', True):
+            return 'rejected'
+        if result.get('risk') == 'NONE':
+            return 'no_wound'
+        return 'analyzed'
+
+    def _with_comparison(self, result: Dict[str, Any], previous_wound_data: Dict) -> Dict[str, Any]:
+        """Fill in wound_comparison against the previous capture, if any"""
+        if previous_wound_data and 'measurements' in result:
+            result['wound_comparison'] = self._compare_wounds(result['measurements'], previous_wound_data)
+        return result
+    
+    def _with_history(self, result: Dict[str, Any], buffer: np.ndarray, signature: Optional[Dict],
+                      patient_id: str, wound_id: str, captured_at: str = None) -> Dict[str, Any]:
+        """Record this capture's signature and attach the wound's trend"""
+        if result.get('error'):
+            return result
+        
+        capture_key = hashlib.sha256(buffer).hexdigest()
+        try:
+            if signature is not None:
+                # The signature is the largest wound's, so record its own risk
+                tracked = (result.get('wounds') or [result])[0]
+                self.history.record(
+                    patient_id, wound_id, capture_key, signature,
+                    risk=tracked.get('risk'),
+                    infection_risk=(tracked.get('infection_analysis') or {}).get('risk_level'),
+                    captured_at=captured_at
+                )
+            captures = self.history.series(patient_id, wound_id)
+            trend = summarize_trend(patient_id, wound_id, captures)
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            # A history failure shouldn't cost the user their analysis
+            result['wound_history'] = {'error': True, 'message': f'Wound history unavailable: {str(e)}'}
+            return result
+        
+        result['wound_history'] = trend
+        
+        # Without client-supplied data, compare against the capture stored just
+        # before this one. That needn't be the latest: a backfilled capture
+        # sorts by its captured_at, and a resent photo keeps its first place
+        keys = [capture['capture_key'] for capture in captures]
+        position = keys.index(capture_key) if capture_key in keys else 0
+        if result.get('wound_comparison') is None and 'measurements' in result and position > 0:
+            previous = captures[position - 1]
+            result['wound_comparison'] = self._compare_wounds(
+                result['measurements'], {'measurements': {'area_pixels': previous['area_pixels']}}
+            )
+        return result
     
-    def _decode_image(self, image_data: str) -> np.ndarray:
-        """Decode base64 image to OpenCV format"""
+    def _image_buffer(self, image_data: Union[str, bytes]) -> Optional[np.ndarray]:
+        """Encoded image bytes as a uint8 array (base64 is decoded, raw bytes are wrapped)"""
         try:
-            # Remove data URL prefix if present
-            if 'base64,' in image_data:
-                image_data = image_data.split('base64,')[1]
+            if isinstance(image_data, str):
+                # Remove data URL prefix if present
+                if 'base64,' in image_data:
+                    image_data = image_data.split('base64,')[1]
+                
+                # Decode base64
+                img_bytes = base64.b64decode(image_data)
+            else:
+                img_bytes = image_data
             
-            # Decode base64
-            img_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(img_bytes, np.uint8)
+            return np.frombuffer(img_bytes, np.uint8)
+        except Exception:
+            return None
+    
+    def _decode_image(self, image_data: Union[str, bytes]) -> np.ndarray:
+        """Decode base64 image (or raw encoded bytes) to OpenCV format"""
+        try:
+            nparr = self._image_buffer(image_data)
             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             return img
         except Exception:
             return None
     
-    def _encode_image(self, img: np.ndarray) -> str:
-        """Encode OpenCV image to base64"""
-        _, buffer = cv2.imencode('.jpg', img)
+    def _encode_image(self, img: np.ndarray, image_format: str = 'jpeg', quality: int = 95) -> str:
+        """Encode OpenCV image to a base64 data URL (image_format is a key of OVERLAY_FORMATS)"""
+        extension, quality_flag, mime_type = OVERLAY_FORMATS[image_format]
+        _, buffer = cv2.imencode(extension, img, [quality_flag, int(quality)])
         img_base64 = base64.b64encode(buffer).decode('utf-8')
-        return f"data:image/jpeg;base64,{img_base64}"
+        return f"data:{mime_type};base64,{img_base64}"
     
-    def _check_photo_quality(self, img: np.ndarray) -> Dict[str, Any]:
+    def _overlay_options_error(self, options: Dict[str, Any]) -> Optional[str]:
+        """What is wrong with a merged set of overlay options, or None if they're usable"""
+        def number(value):
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        
+        if not isinstance(options['format'], str) or options['format'] not in OVERLAY_FORMATS:
+            return f"format must be one of: {', '.join(OVERLAY_FORMATS)}"
+        quality = options['quality']
+        if not (isinstance(quality, int) and not isinstance(quality, bool) and 0 <= quality <= 100):
+            return "quality must be a whole number from 0 to 100"
+        if not (number(options['max_edge']) and 0 < options['max_edge'] < float('inf')):
+            return "max_edge must be a number of pixels above 0"
+        if not (number(options['epsilon']) and 0 <= options['epsilon'] < float('inf')):
+            return "epsilon must be a number of pixels (0 or more)"
+        return None
+    
+    def _render_overlay(self, img: np.ndarray, contours: List, mode: str,
+                        options: Dict[str, Any], allocate: Callable = np.empty) -> Dict[str, Any]:
+        """Produce the result fields for the requested overlay mode"""
+        if mode == 'none':
+            return {}
+        
+        if mode == 'vector':
+            height, width = img.shape[:2]
+            wounds = []
+            for contour in contours:
+                if options['epsilon'] > 0:
+                    contour = cv2.approxPolyDP(contour, options['epsilon'], True)
+                x, y, w, h = cv2.boundingRect(contour)
+                wounds.append({
+                    # Flat [x0, y0, x1, y1, ...] polyline, closed
+                    'contour': contour.reshape(-1).tolist(),
+                    'bounding_box': {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
+                })
+            return {'overlay_geometry': {'width': width, 'height': height, 'wounds': wounds}}
+        
+        if mode == 'thumbnail':
+            scale = options['max_edge'] / max(img.shape[:2])
+            if scale < 1.0:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                contours = [np.round(c * scale).astype(np.int32) for c in contours]
+        
+        canvas = allocate(img.shape, img.dtype)
+        np.copyto(canvas, img)
+        annotated_img = self._draw_annotations(canvas, contours)
+        return {'visual_overlay': self._encode_image(annotated_img, options['format'], options['quality'])}
+    
+    def _check_photo_quality(self, ctx: FrameContext) -> Dict[str, Any]:
         """Check if photo quality is acceptable for analysis"""
+        height, width = ctx.img.shape[:2]
+        return self._quality_report(width, height, ctx.brightness, ctx.sharpness)
+    
+    def _quality_report(self, width: int, height: int, avg_brightness: float,
+                        laplacian_var: float) -> Dict[str, Any]:
+        """Score resolution, brightness and sharpness into the photo_quality structure"""
         issues = []
         quality_score = 100
         
         # Check resolution
-        height, width = img.shape[:2]
         if height < self.min_resolution[0] or width < self.min_resolution[1]:
             issues.append(f"Resolution too low ({width}x{height}). Minimum: {self.min_resolution[0]}x{self.min_resolution[1]}")
             quality_score -= 40
         
         # Check brightness
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        avg_brightness = np.mean(gray)
-        
         if avg_brightness < self.min_brightness:
             issues.append("Image too dark. Use better lighting.")
             quality_score -= 30
@@ -153,7 +1153,6 @@ class WoundAnalyzer:
             quality_score -= 20
         
         # Check blur (Laplacian variance)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
         if laplacian_var < self.blur_threshold:
             issues.append("Image is blurry. Hold camera steady and focus on wound.")
             quality_score -= 30
@@ -168,35 +1167,111 @@ class WoundAnalyzer:
             'sharpness': float(laplacian_var)
         }
     
-    def _detect_wounds(self, img: np.ndarray) -> Tuple[np.ndarray, List]:
-        """Detect wounds using HSV color space red detection"""
-        # Convert to HSV
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    def _fast_quality_gate(self, buffer: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Cheap quality check before the full-resolution decode
+        Dimensions come from the image header; brightness and blur are estimated
+        from a reduced-size grayscale decode. Returns the photo_quality report if
+        the photo is rejected, or None when it needs the full check.
+        """
+        size = read_image_size(buffer)
+        if size is None:
+            return None
+        width, height = size
+        
+        # Skip the gate when even the worst brightness and blur could not fail it
+        if self._quality_report(width, height, 0.0, 0.0)['is_acceptable']:
+            return None
         
-        # Define red color ranges (two ranges for red in HSV)
-        lower_red1 = np.array([0, 50, 50])
-        upper_red1 = np.array([10, 255, 255])
-        lower_red2 = np.array([170, 50, 50])
-        upper_red2 = np.array([180, 255, 255])
+        mode = reduced_grayscale_mode(width, height, self.gate_min_edge)
+        if mode is None:
+            return None  # Small enough that the full decode is cheap anyway
+        factor, flag = mode
         
-        # Create masks
-        mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-        mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        wound_mask = cv2.bitwise_or(mask1, mask2)
+        small = cv2.imdecode(buffer, flag)
+        if small is None:
+            return None
         
-        # Morphological operations to clean up mask
-        kernel = np.ones((5, 5), np.uint8)
-        wound_mask = cv2.morphologyEx(wound_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-        wound_mask = cv2.morphologyEx(wound_mask, cv2.MORPH_OPEN, kernel, iterations=1)
+        # The decoder applies EXIF orientation; follow it for the resolution check
+        if (small.shape[0] > small.shape[1]) != (height > width):
+            width, height = height, width
         
-        # Find contours
-        contours, _ = cv2.findContours(wound_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        report = self._preview_quality(small, factor, width, height)
+        return None if report['is_acceptable'] else report
+    
+    def _preview_quality(self, small: np.ndarray, factor: int, width: int, height: int) -> Dict[str, Any]:
+        """
+        Conservative photo_quality estimate from a grayscale decode reduced by
+        `factor` of a width x height image
+        Brightness and sharpness only count against the photo when clearly past
+        their thresholds, so an acceptable estimate can still fail the full
+        check. The reported brightness and sharpness are the preview's own.
+        """
+        brightness = float(np.mean(small))
+        sharpness = laplacian_variance(small)
         
-        # Filter small contours (noise)
-        min_area = 500
-        contours = [c for c in contours if cv2.contourArea(c) > min_area]
+        # Only estimates clearly past their threshold count against the photo
+        mid_brightness = (self.min_brightness + self.max_brightness) / 2
+        scored_brightness = mid_brightness
+        if (brightness < self.min_brightness - self.gate_brightness_margin or
+                brightness > self.max_brightness + self.gate_brightness_margin):
+            scored_brightness = brightness
+        # Averaging f x f pixels cuts the Laplacian variance of pixel noise by
+        # about f^2, so scale up before comparing to bound the full-res value
+        scored_sharpness = float('inf')
+        if sharpness * factor ** 2 < self.blur_threshold * self.gate_blur_ratio:
+            scored_sharpness = sharpness
         
-        return wound_mask, contours
+        report = self._quality_report(width, height, scored_brightness, scored_sharpness)
+        report['brightness'] = brightness
+        report['sharpness'] = sharpness
+        return report
+    
+    def _quality_rejection(self, quality_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Response for a photo that failed the quality check"""
+        return {
+            'risk': 'UNKNOWN',
+            'confidence': 0.0,
+            'message': 'Photo quality is insufficient for analysis. Please retake the photo.',
+            'photo_quality': quality_result,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _find_wounds(self, ctx: FrameContext) -> List[Tuple[int, np.ndarray]]:
+        """
+        Wound regions of the cleaned-up red mask as (component label, contour)
+        Contours are in this level's coordinates.
+        """
+        count, labels, stats, _ = ctx.wound_components
+        
+        # A contour's area never exceeds its bounding box, so regions whose box
+        # is within the (level-scaled) limit are noise - drop them all at once
+        min_area = self.min_wound_area * ctx.scale ** 2
+        box_areas = stats[:, cv2.CC_STAT_WIDTH].astype(np.int64) * stats[:, cv2.CC_STAT_HEIGHT]
+        keep = box_areas > min_area
+        keep[0] = False  # Background
+        if not keep.any():
+            return []
+        
+        # Outer contours of the cleaned-up red mask; every contour point lies
+        # on its region, so one pixel lookup gives its label
+        contours, _ = cv2.findContours(ctx.wound_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        starts = np.array([c[0, 0] for c in contours]).reshape(-1, 2)
+        contour_labels = labels[starts[:, 1], starts[:, 0]]
+        
+        return [(int(label), contour) for label, contour in zip(contour_labels, contours)
+                if keep[label] and cv2.contourArea(contour) > min_area]
+    
+    def _rank_wounds(self, ctx: FrameContext,
+                     regions: List[Tuple[int, np.ndarray]]) -> Tuple[List[int], List[np.ndarray]]:
+        """
+        (labels, full-resolution contours) of `_find_wounds` regions, largest
+        wound first; numbering in `wounds` and the overlay follows this order
+        """
+        contours = [ctx.to_full_resolution(c) for _, c in regions]
+        areas = [cv2.contourArea(c) for c in contours]
+        order = sorted(range(len(regions)), key=lambda i: areas[i], reverse=True)
+        return [regions[i][0] for i in order], [contours[i] for i in order]
     
     def _measure_wound(self, contour: np.ndarray) -> Dict[str, Any]:
         """Measure wound dimensions"""
@@ -228,34 +1303,43 @@ class WoundAnalyzer:
             'bounding_box': {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
         }
     
-    def _classify_wound(self, img: np.ndarray, wound_mask: np.ndarray, 
-                       contour: np.ndarray) -> List[str]:
+    def _classify_wound(self, ctx: FrameContext, contour: np.ndarray) -> List[str]:
         """Classify wound type"""
-        wound_types = []
-        
         # Get wound region
         x, y, w, h = cv2.boundingRect(contour)
-        wound_region = img[y:y+h, x:x+w]
-        wound_region_mask = wound_mask[y:y+h, x:x+w]
+        gray_wound = ctx.gray[y:y+h, x:x+w]
         
-        if wound_region.size == 0:
+        if gray_wound.size == 0:
             return ["Unknown wound type"]
         
-        # Convert to grayscale and HSV
-        gray_wound = cv2.cvtColor(wound_region, cv2.COLOR_BGR2GRAY)
-        hsv_wound = cv2.cvtColor(wound_region, cv2.COLOR_BGR2HSV)
+        # Burn detection (look for charring/white areas), both read off one
+        # gray histogram of the box
+        histogram = cv2.calcHist([gray_wound], [0], None, [256], [0, 256]).ravel()
+        charred = histogram[:self.charred_gray].sum() / gray_wound.size
+        white_tissue = histogram[self.white_tissue_gray + 1:].sum() / gray_wound.size
+        burn = self._burn_type(charred, white_tissue)
         
-        # Burn detection (look for charring/white areas)
-        charred = np.sum(gray_wound < 50) / gray_wound.size
-        white_tissue = np.sum(gray_wound > 200) / gray_wound.size
+        wound_types = ([burn] if burn else []) + self._shape_types(contour)
         
-        if charred > 0.15 or white_tissue > 0.2:
-            if charred > 0.3:
-                wound_types.append("3rd Degree Burn (charred tissue - EMERGENCY)")
-            elif white_tissue > 0.3:
-                wound_types.append("2nd Degree Burn (blisters/white tissue)")
-            else:
-                wound_types.append("1st Degree Burn (redness)")
+        # If no specific type detected
+        if not wound_types:
+            wound_types.append("Open wound (general)")
+        
+        return wound_types
+    
+    def _burn_type(self, charred: float, white_tissue: float) -> Optional[str]:
+        """Burn degree from the charred and white shares of a wound's box, if any"""
+        if charred > self.burn_charred_ratio or white_tissue > self.burn_white_ratio:
+            if charred > self.third_degree_ratio:
+                return BURN_TYPES[2]
+            elif white_tissue > self.second_degree_ratio:
+                return BURN_TYPES[1]
+            return BURN_TYPES[0]
+        return None
+    
+    def _shape_types(self, contour: np.ndarray) -> List[str]:
+        """Wound types told apart by the outline alone"""
+        wound_types = []
         
         # Laceration vs abrasion (edge analysis)
         perimeter = cv2.arcLength(contour, True)
@@ -272,58 +1356,166 @@ class WoundAnalyzer:
         if area < 2000 and circularity > 0.7:
             wound_types.append("Puncture wound (deep)")
         
-        # If no specific type detected
-        if not wound_types:
-            wound_types.append("Open wound (general)")
-        
         return wound_types
     
-    def _detect_infection(self, img: np.ndarray, wound_mask: np.ndarray) -> Dict[str, Any]:
-        """Detect signs of infection"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        signs = []
-        risk_factors = 0
+    def _wound_signature(self, ctx: FrameContext, contour: np.ndarray,
+                         measurements: Dict[str, Any]) -> Dict[str, Any]:
+        """Compact, JSON-safe description of one wound for the history store"""
+        x, y, w, h = cv2.boundingRect(contour)
+        mask = np.zeros((h, w), np.uint8)
+        cv2.drawContours(mask, [contour], -1, 255, -1, offset=(-x, -y))
+        pixels = max(cv2.countNonZero(mask), 1)
+        
+        # Colour classes inside the wound outline only: one histogram of the
+        # box's class map, masked by the outline
+        classes = self.color_classifier.classify(ctx.img[y:y+h, x:x+w])
+        histogram = cv2.calcHist([classes], [0], mask, [256], [0, 256]).ravel()
+        names = {'red': WOUND_RED, 'intense_red': INTENSE_RED, 'yellow': DISCHARGE_YELLOW,
+                 'green': DISCHARGE_GREEN, 'charred': CHARRED, 'white': WHITE_TISSUE}
+        color_ratios = {name: round(class_count(histogram, bit) / pixels, 4) for name, bit in names.items()}
+        
+        area = cv2.contourArea(contour)
+        perimeter = cv2.arcLength(contour, True)
+        circularity = 4 * np.pi * area / (perimeter ** 2) if perimeter > 0 else 0.0
+        
+        return {
+            'area_pixels': measurements['area_pixels'],
+            'bounding_box': measurements['bounding_box'],
+            'circularity': round(float(circularity), 4),
+            'color_ratios': color_ratios,
+            'mask_rle': base64.b64encode(encode_mask_rle(mask)).decode('ascii')
+        }
+    
+    def _detect_wound_infections(self, ctx: FrameContext, wound_labels: List[int],
+                                 inflammation_ring: bool = True) -> List[Dict[str, Any]]:
+        """
+        Signs of infection for each labelled wound region, in one pass
+        Discharge and necrotic pixels are tallied per label over the wounds'
+        combined box. Each wound's inflammation ring is the non-wound pixels
+        within the ring radius (three dilations by the inflammation kernel);
+        a pixel in reach of several wounds counts for the largest, so
+        rings of neighbouring wounds split their overlap instead of counting
+        it twice.
+        Without `inflammation_ring` the rings are not examined at all.
+        """
+        count, labels, stats, _ = ctx.wound_components
+        if not wound_labels:
+            return []
+        
+        ring_radius = self._ring_radius(ctx) if inflammation_ring else 0
+        window = self._infection_window(ctx, wound_labels, ring_radius)
+        label_view = labels[window]
+        classes = ctx.color_classes_in(window)
+        
+        # Yellow/green discharge and dark tissue, tallied per label
+        discharge_counts = np.bincount(label_view[(classes & DISCHARGE) > 0], minlength=count)
+        necrotic_counts = np.bincount(label_view[(classes & NECROTIC) > 0], minlength=count)
+        
+        if not inflammation_ring:
+            ring_counts = np.ones(count, np.int64)
+            inflamed_counts = np.zeros(count, np.int64)
+        else:
+            # Intense red in each wound's ring (any wound pixel excluded)
+            ring, nearest = self._inflammation_rings(ctx, wound_labels, ring_radius, window)
+            intense_red_mask = class_mask(classes, INTENSE_RED)
+            
+            if nearest is None:
+                ring_counts = np.zeros(count, np.int64)
+                inflamed_counts = np.zeros(count, np.int64)
+                ring_counts[wound_labels[0]] = cv2.countNonZero(ring)
+                inflamed_counts[wound_labels[0]] = cv2.countNonZero(cv2.bitwise_and(intense_red_mask, ring))
+            else:
+                ring_counts = np.bincount(nearest[ring], minlength=count)
+                inflamed_counts = np.bincount(nearest[ring & (intense_red_mask > 0)], minlength=count)
         
-        # Detect yellow/green discharge (pus)
-        lower_yellow = np.array([20, 50, 50])
-        upper_yellow = np.array([40, 255, 255])
-        lower_green = np.array([40, 50, 50])
-        upper_green = np.array([80, 255, 255])
+        results = []
+        for label in wound_labels:
+            pixels = max(int(stats[label, cv2.CC_STAT_AREA]), 1)
+            results.append(self._infection_verdict(
+                discharge_counts[label] / pixels,
+                necrotic_counts[label] / pixels,
+                inflamed_counts[label] / max(int(ring_counts[label]), 1)
+            ))
+        return results
+    
+    def _ring_radius(self, ctx: FrameContext) -> int:
+        """How far a wound's inflammation ring reaches, in this level's pixels"""
+        # Three dilations by a k x k square equal one dilation by a
+        # (3(k-1)+1) square
+        kernel = ctx.scaled_kernel(self.inflammation_kernel)
+        return 3 * (kernel.shape[0] // 2)
+    
+    def _infection_window(self, ctx: FrameContext, wound_labels: List[int],
+                          ring_radius: int) -> Tuple[slice, slice]:
+        """Slices of the box holding every labelled wound plus its ring"""
+        stats = ctx.wound_components[2]
+        img_h, img_w = ctx.wound_mask.shape[:2]
+        boxes = stats[wound_labels, :4]
+        x0 = max(int(boxes[:, 0].min()) - ring_radius, 0)
+        y0 = max(int(boxes[:, 1].min()) - ring_radius, 0)
+        x1 = min(int((boxes[:, 0] + boxes[:, 2]).max()) + ring_radius, img_w)
+        y1 = min(int((boxes[:, 1] + boxes[:, 3]).max()) + ring_radius, img_h)
+        return slice(y0, y1), slice(x0, x1)
+    
+    def _inflammation_rings(self, ctx: FrameContext, wound_labels: List[int], ring_radius: int,
+                            window: Tuple[slice, slice]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        (ring, nearest) over `window`: ring is nonzero on ring pixels, and
+        nearest gives the label of the wound each pixel's ring belongs to, or
+        is None when a lone wound owns the whole ring
+        """
+        count, labels = ctx.wound_components[:2]
+        label_view = labels[window]
+        wound_mask = ctx.wound_mask[window]
+        ring_kernel = np.ones((2 * ring_radius + 1, 2 * ring_radius + 1), np.uint8)
         
-        yellow_mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
-        green_mask = cv2.inRange(hsv, lower_green, upper_green)
-        discharge_mask = cv2.bitwise_or(yellow_mask, green_mask)
+        if len(wound_labels) == 1:
+            # A lone wound owns its whole ring: one square dilation
+            wound_view = cv2.compare(label_view, int(wound_labels[0]), cv2.CMP_EQ)
+            return cv2.subtract(cv2.dilate(wound_view, ring_kernel), wound_mask), None
         
-        # Check for discharge in wound area
-        discharge_in_wound = cv2.bitwise_and(discharge_mask, wound_mask)
-        discharge_ratio = np.sum(discharge_in_wound > 0) / max(np.sum(wound_mask > 0), 1)
+        # Code wounds by rank, largest highest; the same square dilation then
+        # gives each pixel the largest wound within its reach, at one pass's
+        # cost however many wounds there are
+        code = np.zeros(count, np.uint16 if len(wound_labels) < 65536 else np.float32)
+        code[wound_labels] = np.arange(len(wound_labels), 0, -1)
+        reach = cv2.dilate(code[label_view], ring_kernel)
+        if reach.dtype != np.uint16:
+            reach = reach.astype(np.int32)
+        to_label = np.zeros(len(wound_labels) + 1, np.int32)
+        to_label[1:] = wound_labels[::-1]
+        return (reach > 0) & (wound_mask == 0), to_label[reach]
+    
+    def _infection_not_assessed(self) -> Dict[str, Any]:
+        """Infection result of a wound whose check was skipped to meet a time budget"""
+        return {
+            'risk_level': 'UNKNOWN',
+            'signs': ['Not assessed within the time budget'],
+            'risk_factors': 0
+        }
+    
+    def _infection_verdict(self, discharge_ratio: float, necrotic_ratio: float,
+                           inflammation_ratio: float) -> Dict[str, Any]:
+        """Infection signs and risk level from the colour ratios of a wound"""
+        return self._infection_from_signs(discharge_ratio > self.discharge_ratio,
+                                          necrotic_ratio > self.necrotic_ratio,
+                                          inflammation_ratio > self.inflammation_ratio)
+    
+    def _infection_from_signs(self, discharge: bool, necrotic: bool, inflamed: bool) -> Dict[str, Any]:
+        """Infection result of a wound from which signs it shows"""
+        signs = []
+        risk_factors = 0
         
-        if discharge_ratio > 0.05:
+        if discharge:
             signs.append("Yellow/green discharge detected (possible pus)")
             risk_factors += 2
         
-        # Detect necrotic tissue (dark/black areas)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        necrotic_mask = cv2.inRange(gray, 0, 40)
-        necrotic_in_wound = cv2.bitwise_and(necrotic_mask, wound_mask)
-        necrotic_ratio = np.sum(necrotic_in_wound > 0) / max(np.sum(wound_mask > 0), 1)
-        
-        if necrotic_ratio > 0.1:
+        if necrotic:
             signs.append("Dark/necrotic tissue detected")
             risk_factors += 2
         
         # Check for excessive inflammation (very intense red around wound)
-        kernel = np.ones((15, 15), np.uint8)
-        dilated_wound = cv2.dilate(wound_mask, kernel, iterations=3)
-        inflammation_area = cv2.subtract(dilated_wound, wound_mask)
-        
-        lower_intense_red = np.array([0, 100, 100])
-        upper_intense_red = np.array([10, 255, 255])
-        intense_red_mask = cv2.inRange(hsv, lower_intense_red, upper_intense_red)
-        inflammation_red = cv2.bitwise_and(intense_red_mask, inflammation_area)
-        inflammation_ratio = np.sum(inflammation_red > 0) / max(np.sum(inflammation_area > 0), 1)
-        
-        if inflammation_ratio > 0.3:
+        if inflamed:
             signs.append("Excessive inflammation around wound")
             risk_factors += 1
         
@@ -344,16 +1536,17 @@ class WoundAnalyzer:
     
     def _draw_annotations(self, img: np.ndarray, contours: List) -> np.ndarray:
         """Draw bounding boxes and annotations on image"""
-        for contour in contours:
-            # Draw contour
-            cv2.drawContours(img, [contour], -1, (0, 255, 0), 3)
-            
+        # Draw every contour in one call
+        cv2.drawContours(img, contours, -1, (0, 255, 0), 3)
+        
+        for index, contour in enumerate(contours):
             # Draw bounding box
             x, y, w, h = cv2.boundingRect(contour)
             cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
             
-            # Add label
-            cv2.putText(img, "WOUND", (x, y - 10), 
+            # Add label, numbered as in `wounds` when there are several
+            label = "WOUND" if len(contours) == 1 else f"WOUND {index + 1}"
+            cv2.putText(img, label, (x, y - 10), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
         
         return img
@@ -523,30 +1716,270 @@ class WoundAnalyzer:
         }
 
 
+def metrics_request(analyzer: WoundAnalyzer, input_data: Dict) -> Dict[str, Any]:
+    """
+    Stage histograms for {"op": "metrics"}
+    `format` is 'json' (default, with p50/p90/p99), 'prometheus' (text under
+    'text') or 'raw' (mergeable snapshot). With `snapshots`, those snapshots
+    (e.g. one per pool worker) are merged and rendered instead of this
+    process's own.
+    """
+    snapshots = input_data.get('snapshots')
+    if snapshots is None:
+        own = analyzer.metrics_snapshot()
+        if own is None:
+            return {'error': True, 'message': 'Metrics are not enabled on this analyzer'}
+        snapshots = [own]
+    
+    merged = merge_snapshots(snapshots)
+    output_format = input_data.get('format') or 'json'
+    if output_format == 'raw':
+        return merged
+    if output_format == 'prometheus':
+        return {'content_type': 'text/plain; version=0.0.4', 'text': to_prometheus(merged)}
+    return to_json(merged)
+
+
+def analyze_request(analyzer: WoundAnalyzer, input_data: Dict, stream: ResultStream = None) -> Dict[str, Any]:
+    """
+    Run one analysis (or a {"op": "stats" | "metrics" | "history"} query) for a parsed request object
+    An `images` list instead of `image` is a burst, see WoundAnalyzer.analyze_burst.
+    Partial results go to `stream`, if given; the caller finishes it.
+    """
+    if input_data.get('op') == 'stats':
+        return analyzer.stats()
+    if input_data.get('op') == 'metrics':
+        return metrics_request(analyzer, input_data)
+    if input_data.get('op') == 'history':
+        if input_data.get('wound_id') is None:
+            return {'error': True, 'message': 'No wound_id provided'}
+        return analyzer.wound_trend(input_data.get('patient_id') or '', input_data['wound_id'])
+    
+    image_data = input_data.get('image', '')
+    images = input_data.get('images')
+    previous_wound_data = input_data.get('previous_wound_data')
+    options = {
+        'overlay': input_data.get('overlay') or 'full',
+        'overlay_options': input_data.get('overlay_options'),
+        'wound_id': input_data.get('wound_id'),
+        'patient_id': input_data.get('patient_id') or '',
+        'captured_at': input_data.get('captured_at'),
+        'diagnostics': bool(input_data.get('diagnostics')),
+        'stream': stream,
+        'budget_ms': input_data.get('budget_ms')
+    }
+    
+    # A burst of frames: only the best one is analyzed
+    if images:
+        return analyzer.analyze_burst(images, previous_wound_data,
+                                      skip_duplicates=bool(input_data.get('skip_duplicates')), **options)
+    
+    if not image_data:
+        return {'error': True, 'message': 'No image data provided'}
+    return analyzer.analyze(image_data, previous_wound_data, **options)
+
+
+def _read_exact(stream, size: int) -> Optional[bytearray]:
+    """Read exactly `size` bytes into one preallocated buffer (None on clean EOF)"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = stream.readinto(view[received:])
+        if not count:
+            if received == 0:
+                return None
+            raise ValueError(f'Truncated frame: expected {size} bytes, got {received}')
+        received += count
+    return buffer
+
+
+def read_binary_frame(stream) -> Optional[Dict]:
+    """
+    Read one binary request frame from a byte stream
+    Frame layout: 4-byte big-endian header length, UTF-8 JSON header, raw image
+    bytes. The header carries `image_length`; without it the image runs to the
+    end of the stream. The image is returned under 'image' as a memoryview over
+    the receive buffer, so it reaches cv2.imdecode without another copy.
+    A burst carries `image_lengths` instead: the frames follow back to back and
+    are returned under 'images' as views over one receive buffer.
+    Returns None at end of stream.
+    """
+    prefix = _read_exact(stream, 4)
+    if prefix is None:
+        return None
+    header_length = struct.unpack('>I', prefix)[0]
+    
+    header_bytes = _read_exact(stream, header_length) if header_length else bytearray()
+    if header_bytes is None:
+        raise ValueError('Truncated frame: missing header')
+    header = json.loads(header_bytes.decode('utf-8')) if header_length else {}
+    
+    image_lengths = header.get('image_lengths')
+    if image_lengths is not None:
+        total = sum(image_lengths)
+        images = _read_exact(stream, total) if total else bytearray()
+        if images is None:
+            raise ValueError('Truncated frame: missing image bytes')
+        view = memoryview(images)
+        header['images'] = []
+        offset = 0
+        for length in image_lengths:
+            header['images'].append(view[offset:offset + length])
+            offset += length
+        return header
+    
+    image_length = header.get('image_length')
+    if image_length is None:
+        image = stream.read()
+    else:
+        image = _read_exact(stream, image_length) if image_length else bytearray()
+        if image is None:
+            raise ValueError('Truncated frame: missing image bytes')
+    
+    header['image'] = memoryview(image)
+    return header
+
+
+def _json_requests(stream) -> Iterator[Tuple[Optional[Dict], Optional[Dict]]]:
+    """Yield (request, error) pairs from newline-delimited JSON"""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield None, {'error': True, 'message': f'Invalid JSON input: {str(e)}'}
+
+
+def _binary_requests(stream) -> Iterator[Tuple[Optional[Dict], Optional[Dict]]]:
+    """Yield (request, error) pairs from length-prefixed binary frames"""
+    while True:
+        try:
+            frame = read_binary_frame(stream)
+        except (ValueError, UnicodeDecodeError) as e:
+            # Framing is lost once a header can't be read, so stop here
+            yield None, {'error': True, 'message': f'Invalid binary frame: {str(e)}'}
+            return
+        if frame is None:
+            return
+        yield frame, None
+
+
+def serve(analyzer: WoundAnalyzer, in_stream=None, out_stream=None, binary: bool = False):
+    """
+    Long-lived worker loop
+    Each request is {"id": ..., "image": ..., "previous_wound_data": ...}, either
+    as one line of JSON or (binary=True) as a binary frame, see read_binary_frame.
+    Each response line is {"id": ..., "result": {...}} with the same id.
+    A request with "stream": true is answered progressively instead, by
+    {"id": ..., "event": ..., "data": {...}} lines ending with the "done" event
+    (see result_stream).
+    A {"ready": true} line is written once the analyzer is warm.
+    """
+    if in_stream is None:
+        in_stream = sys.stdin.buffer if binary else sys.stdin
+    out_stream = out_stream or sys.stdout
+    
+    def write(frame: Dict):
+        out_stream.write(json.dumps(frame) + '\n')
+        out_stream.flush()
+    
+    requests = _binary_requests(in_stream) if binary else _json_requests(in_stream)
+    
+    write({'ready': True})
+    for input_data, result in requests:
+        request_id = None
+        stream = None
+        if input_data is not None:
+            request_id = input_data.get('id')
+            if input_data.get('stream'):
+                stream = ResultStream(
+                    lambda event, data: write({'id': request_id, 'event': event, 'data': data})
+                )
+            try:
+                result = analyze_request(analyzer, input_data, stream)
+            except Exception as e:
+                result = {'error': True, 'message': f'Unexpected error: {str(e)}'}
+        
+        if stream is not None:
+            stream.finish(result)
+        else:
+            write({'id': request_id, 'result': result})
+
+
 def main():
-    """Main entry point - reads JSON from stdin, outputs JSON to stdout"""
+    """Main entry point - reads a JSON (or binary frame) request from stdin, outputs JSON to stdout"""
+    parser = argparse.ArgumentParser(description='Trauma Eye wound analysis')
+    parser.add_argument('--serve', action='store_true',
+                        help='run as a persistent worker reading NDJSON requests from stdin')
+    parser.add_argument('--binary', action='store_true',
+                        help='read length-prefixed binary frames (JSON header + raw image bytes) '
+                             'instead of base64 JSON')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep an in-memory cache of results for repeat submissions (with --serve)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory for an on-disk result cache shared across processes')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='maximum cached results held in memory (default: 64)')
+    parser.add_argument('--cache-ttl', type=float, default=600.0,
+                        help='seconds a cached result stays valid (default: 600)')
+    parser.add_argument('--history-db', default=None,
+                        help='SQLite file of per-wound signatures; requests with a wound_id are '
+                             'recorded there and get a trend over the full series')
+    parser.add_argument('--tile-threads', type=int, default=0,
+                        help='split large frames into bands processed on this many threads '
+                             '(default: 0, whole-frame)')
+    parser.add_argument('--stream', action='store_true',
+                        help='write the result progressively as NDJSON events (quality, detection, '
+                             'risk, overlay, done) instead of one JSON document; with --serve, '
+                             'requests ask for this with "stream": true')
+    parser.add_argument('--buffer-pool-mb', type=int, default=256,
+                        help='with --serve, keep up to this many MB of per-request intermediates '
+                             'for reuse (default: 256, 0 disables)')
+    parser.add_argument('--max-working-edge', type=int, default=None,
+                        help='segment wounds on a pyramid level with at most this long an edge; '
+                             'faster on large photos but area and wound types may shift '
+                             '(default: full resolution)')
+    args = parser.parse_args()
+    
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = ResultCache(max_entries=args.cache_size, ttl_seconds=args.cache_ttl,
+                            directory=args.cache_dir, memory=args.serve)
+    history = WoundHistory(args.history_db) if args.history_db else None
+    
+    if args.serve:
+        buffer_pool = BufferPool(args.buffer_pool_mb * 1024 * 1024) if args.buffer_pool_mb > 0 else None
+        analyzer = WoundAnalyzer(cache=cache, history=history, metrics=StageMetrics(), color_lut=True,
+                                 tile_threads=args.tile_threads, buffer_pool=buffer_pool,
+                                 max_working_edge=args.max_working_edge)
+        analyzer.warm_up()
+        serve(analyzer, binary=args.binary)
+        sys.exit(0)
+    
     try:
-        # Read input from stdin
-        input_str = sys.stdin.read()
+        if args.binary:
+            input_data = read_binary_frame(sys.stdin.buffer)
+        else:
+            # Read input from stdin
+            input_str = sys.stdin.read()
+            input_data = json.loads(input_str) if input_str.strip() else None
         
-        if not input_str.strip():
+        if input_data is None:
             result = {'error': True, 'message': 'No input data received'}
             print(json.dumps(result), flush=True)
             sys.exit(1)
         
-        # Parse JSON
-        input_data = json.loads(input_str)
-        
-        # Extract image and previous data
-        image_data = input_data.get('image', '')
-        previous_wound_data = input_data.get('previous_wound_data')
-        
-        if not image_data:
-            result = {'error': True, 'message': 'No image data provided'}
-        else:
-            # Analyze wound
-            analyzer = WoundAnalyzer()
-            result = analyzer.analyze(image_data, previous_wound_data)
+        # Analyze wound
+        analyzer = WoundAnalyzer(cache=cache, history=history, tile_threads=args.tile_threads,
+                                 max_working_edge=args.max_working_edge)
+        if args.stream:
+            stream = ResultStream(lambda event, data: print(json.dumps({'event': event, 'data': data}),
+                                                            flush=True))
+            stream.finish(analyze_request(analyzer, input_data, stream))
+            sys.exit(0)
+        result = analyze_request(analyzer, input_data)
         
         # Output result as JSON with flush
         print(json.dumps(result), flush=True)
@@ -0,0 +1,261 @@
+const { spawn } = require('child_process');
+const path = require('path');
+
+/**
+ * Pool of long-lived `trauma_eye.py --serve` workers
+ *
+ * Each worker keeps one warmed WoundAnalyzer alive. We write one request per
+ * {"id", "image", "previous_wound_data"} and read back {"id", "result"} lines.
+ * Requests go out as newline-delimited JSON, or with `binary` as
+ * length-prefixed frames (JSON header + raw image bytes) so Python never
+ * has to hold the base64 text. A worker handles one request at a time;
+ * extra requests wait in a FIFO queue until a worker frees up.
+ */
+class PythonWorkerPool {
+  constructor({
+    size = 2,
+    pythonPath = 'python3',
+    scriptPath = path.join(__dirname, 'trauma_eye.py'),
+    timeoutMs = 30000,
+    respawnDelayMs = 1000,
+    binary = false,
+    extraArgs = []
+  } = {}) {
+    this.size = size;
+    this.pythonPath = pythonPath;
+    this.scriptPath = scriptPath;
+    this.timeoutMs = timeoutMs;
+    this.respawnDelayMs = respawnDelayMs;
+    this.binary = binary;
+    this.extraArgs = extraArgs;
+    this.workers = [];
+    this.queue = [];
+    this.nextId = 1;
+
+    for (let i = 0; i < size; i++) {
+      this.workers.push(this._spawnWorker());
+    }
+  }
+
+  /**
+   * Queue a request for the next idle worker (or only `worker`, if given)
+   * Resolves with the analysis result, rejects on timeout or worker failure.
+   * With `onEvent`, the worker streams the result and onEvent(event, data) is
+   * called for each slice as it arrives (quality, detection, risk, overlay,
+   * done); the promise still resolves with the merged result.
+   */
+  analyze(payload, { worker = null, onEvent = null } = {}) {
+    return new Promise((resolve, reject) => {
+      const job = {
+        id: this.nextId++,
+        payload: onEvent ? { ...payload, stream: true } : payload,
+        resolve,
+        reject,
+        worker: null,
+        pin: worker,
+        onEvent,
+        partial: {}
+      };
+
+      // The timeout covers time spent queued as well as time spent analyzing
+      job.timer = setTimeout(() => {
+        const error = new Error('Analysis timeout');
+        error.code = 'ETIMEDOUT';
+
+        if (job.worker) {
+          // The analysis can't be interrupted mid-stage, so recycle the worker
+          job.worker.job = null;
+          this._replaceWorker(job.worker);
+        } else {
+          this.queue.splice(this.queue.indexOf(job), 1);
+        }
+        reject(error);
+      }, this.timeoutMs);
+
+      this.queue.push(job);
+      this._dispatch();
+    });
+  }
+
+  /**
+   * Send the same request to every live worker, e.g. to collect per-process
+   * metrics. Resolves with the results of the workers that answered.
+   */
+  async broadcast(payload) {
+    const live = this.workers.filter(w => w.proc && !w.dead);
+    const settled = await Promise.allSettled(live.map(worker => this.analyze(payload, { worker })));
+    return settled.filter(s => s.status === 'fulfilled').map(s => s.value);
+  }
+
+  _spawnWorker() {
+    const args = [this.scriptPath, '--serve', ...(this.binary ? ['--binary'] : []), ...this.extraArgs];
+    const proc = spawn(this.pythonPath, args);
+    const worker = { proc, ready: false, job: null, buffer: '', stderr: '' };
+
+    proc.stdout.on('data', (data) => {
+      worker.buffer += data.toString();
+
+      let newline;
+      while ((newline = worker.buffer.indexOf('\n')) >= 0) {
+        const line = worker.buffer.slice(0, newline);
+        worker.buffer = worker.buffer.slice(newline + 1);
+        if (line.trim()) {
+          this._handleFrame(worker, line);
+        }
+      }
+    });
+
+    proc.stderr.on('data', (data) => {
+      // Keep only the tail so a chatty worker can't grow this unbounded
+      worker.stderr = (worker.stderr + data.toString()).slice(-4096);
+    });
+
+    proc.stdin.on('error', () => {
+      // EPIPE when the worker dies mid-write; the 'exit' handler cleans up
+    });
+
+    proc.on('error', (error) => {
+      console.error('Failed to start Python worker:', error);
+      this._failWorker(worker, new Error('Analysis service unavailable'));
+    });
+
+    proc.on('exit', (code, signal) => {
+      if (worker.stderr) {
+        console.error(`Python worker exited (code=${code}, signal=${signal}):`, worker.stderr);
+      }
+      this._failWorker(worker, new Error('Analysis worker exited unexpectedly'));
+    });
+
+    return worker;
+  }
+
+  _handleFrame(worker, line) {
+    let frame;
+    try {
+      frame = JSON.parse(line);
+    } catch (parseError) {
+      console.error('Failed to parse Python worker output:', line.slice(0, 200));
+      return;
+    }
+
+    if (frame.ready) {
+      worker.ready = true;
+      this._dispatch();
+      return;
+    }
+
+    const job = worker.job;
+    if (!job || frame.id !== job.id) {
+      return; // Stale response for a request that already timed out
+    }
+
+    let result = frame.result;
+    if (frame.event) {
+      // Streamed slice; later slices replace earlier keys
+      Object.assign(job.partial, frame.data);
+      if (job.onEvent) job.onEvent(frame.event, frame.data);
+      if (frame.event !== 'done') return;
+      result = job.partial;
+    }
+
+    clearTimeout(job.timer);
+    worker.job = null;
+    job.resolve(result);
+    this._dispatch();
+  }
+
+  _dispatch() {
+    for (const worker of this.workers) {
+      if (this.queue.length === 0) return;
+      if (!worker.ready || worker.job) continue;
+
+      // Oldest job this worker may take
+      const index = this.queue.findIndex(job => !job.pin || job.pin === worker);
+      if (index < 0) continue;
+
+      const [job] = this.queue.splice(index, 1);
+      job.worker = worker;
+      worker.job = job;
+      for (const chunk of this._encodeRequest(job.id, job.payload)) {
+        worker.proc.stdin.write(chunk);
+      }
+    }
+  }
+
+  _encodeRequest(id, payload) {
+    if (!this.binary) {
+      return [JSON.stringify({ id, ...payload }) + '\n'];
+    }
+
+    // Frame: 4-byte big-endian header length, JSON header, raw image bytes
+    const { image, images, ...meta } = payload;
+    if (images) {
+      // Burst: the frames follow the header back to back
+      const frames = images.map(toImageBytes);
+      const header = Buffer.from(JSON.stringify({
+        id, ...meta, image_lengths: frames.map(frame => frame.length)
+      }));
+      return [headerPrefix(header), header, ...frames];
+    }
+
+    // Queries such as {"op": "history"} carry no image
+    const imageBytes = image ? toImageBytes(image) : Buffer.alloc(0);
+    const header = Buffer.from(JSON.stringify({ id, ...meta, image_length: imageBytes.length }));
+    return [headerPrefix(header), header, imageBytes]; // Written separately to avoid copying the image
+  }
+
+  _failWorker(worker, error) {
+    if (worker.dead) return;
+    worker.dead = true;
+
+    if (worker.job) {
+      clearTimeout(worker.job.timer);
+      worker.job.reject(error);
+      worker.job = null;
+    }
+    this._replaceWorker(worker);
+  }
+
+  _replaceWorker(worker) {
+    const index = this.workers.indexOf(worker);
+    if (index < 0) return;
+
+    worker.dead = true;
+    worker.proc.kill('SIGKILL');
+
+    // Jobs pinned to this worker can't run anywhere else
+    for (const job of this.queue.filter(j => j.pin === worker)) {
+      this.queue.splice(this.queue.indexOf(job), 1);
+      clearTimeout(job.timer);
+      job.reject(new Error('Analysis worker exited unexpectedly'));
+    }
+
+    if (worker.ready) {
+      this.workers[index] = this._spawnWorker();
+    } else {
+      // Worker died before warming up (missing Python/OpenCV?) - back off
+      // instead of respawning in a tight loop
+      const placeholder = { ready: false, job: null, dead: true };
+      this.workers[index] = placeholder;
+      setTimeout(() => {
+        const slot = this.workers.indexOf(placeholder);
+        if (slot >= 0) this.workers[slot] = this._spawnWorker();
+      }, this.respawnDelayMs);
+    }
+  }
+}
+
+// Raw bytes of a Buffer, base64 string or data URL
+function toImageBytes(image) {
+  if (Buffer.isBuffer(image)) return image;
+  const marker = image.indexOf('base64,');
+  return Buffer.from(marker >= 0 ? image.slice(marker + 7) : image, 'base64');
+}
+
+function headerPrefix(header) {
+  const prefix = Buffer.alloc(4);
+  prefix.writeUInt32BE(header.length, 0);
+  return prefix;
+}
+
+module.exports = { PythonWorkerPool };
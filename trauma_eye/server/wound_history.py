@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Wound History
+Longitudinal store of per-capture wound signatures, so a follow-up photo only
+needs a patient/wound id to be compared against the whole series instead of
+the client sending the previous result back every time.
+
+Each capture keeps a compact signature: area, bounding box, circularity,
+colour-class ratios inside the wound and a run-length encoded wound mask
+(cropped to the bounding box). Images and full results are never stored.
+Backed by SQLite, so several worker processes can share one file.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    wound_id TEXT NOT NULL,
+    captured_at TEXT NOT NULL,
+    capture_key TEXT NOT NULL,
+    area_pixels INTEGER NOT NULL,
+    bbox_x INTEGER NOT NULL,
+    bbox_y INTEGER NOT NULL,
+    bbox_w INTEGER NOT NULL,
+    bbox_h INTEGER NOT NULL,
+    circularity REAL NOT NULL,
+    color_ratios TEXT NOT NULL,
+    risk TEXT,
+    infection_risk TEXT,
+    mask_rle BLOB NOT NULL,
+    UNIQUE (patient_id, wound_id, capture_key)
+);
+CREATE INDEX IF NOT EXISTS captures_by_wound ON captures (patient_id, wound_id, captured_at);
+"""
+
+# Area change (percent) between two captures that counts as a real change
+SIGNIFICANT_CHANGE_PERCENT = 10.0
+
+# Rise in the discharge (yellow/green) ratio that raises an infection alert
+DISCHARGE_ALERT_DELTA = 0.05
+
+
+def encode_mask_rle(mask: np.ndarray) -> bytes:
+    """
+    Run-length encode a binary mask (row-major)
+    Layout: height and width as uint32, then alternating background/foreground
+    run lengths as uint32, starting with background.
+    """
+    flat = (mask.ravel() > 0).astype(np.int8)
+    boundaries = np.flatnonzero(np.diff(flat)) + 1
+    edges = np.concatenate(([0], boundaries, [flat.size]))
+    runs = np.diff(edges)
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))  # First run is always background
+    header = np.array(mask.shape[:2], dtype=np.uint32)
+    return header.tobytes() + runs.astype(np.uint32).tobytes()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    ISO 8601 timestamp as an aware UTC datetime
+    Values without an offset are taken as local time. Raises ValueError for
+    anything that isn't an ISO 8601 timestamp.
+    """
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid captured_at {value!r}. Use an ISO 8601 timestamp") from None
+    return moment.astimezone(timezone.utc)
+
+
+def decode_mask_rle(data: bytes) -> np.ndarray:
+    """Inverse of encode_mask_rle, as a uint8 mask of 0/255"""
+    values = np.frombuffer(data, dtype=np.uint32)
+    height, width = int(values[0]), int(values[1])
+    runs = values[2:].astype(np.int64)
+    labels = np.zeros(len(runs), np.uint8)
+    labels[1::2] = 255
+    return np.repeat(labels, runs).reshape(height, width)
+
+
+class WoundHistory:
+    """SQLite-backed series of wound signatures, indexed by patient and wound"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Workers in other processes may hold the write lock briefly
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def record(self, patient_id: str, wound_id: str, capture_key: str,
+               signature: Dict[str, Any], risk: str = None, infection_risk: str = None,
+               captured_at: str = None) -> bool:
+        """
+        Append one capture's signature to a wound's series
+        A capture_key (image digest) already recorded for this wound is ignored,
+        so client retries don't count twice. captured_at (default: now) is
+        stored in UTC, so timestamps with and without an offset order and
+        subtract consistently. Returns True if a row was added.
+        """
+        moment = parse_timestamp(captured_at) if captured_at is not None else datetime.now(timezone.utc)
+        bbox = signature['bounding_box']
+        row = (
+            str(patient_id), str(wound_id), moment.isoformat(timespec='microseconds'), capture_key,
+            int(signature['area_pixels']), bbox['x'], bbox['y'], bbox['w'], bbox['h'],
+            float(signature['circularity']), json.dumps(signature['color_ratios'], sort_keys=True),
+            risk, infection_risk, signature['mask_rle']
+        )
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO captures (patient_id, wound_id, captured_at, capture_key, '
+                'area_pixels, bbox_x, bbox_y, bbox_w, bbox_h, circularity, color_ratios, '
+                'risk, infection_risk, mask_rle) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                row
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def series(self, patient_id: str, wound_id: str, include_masks: bool = False) -> List[Dict[str, Any]]:
+        """All captures of one wound, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM captures WHERE patient_id = ? AND wound_id = ? ORDER BY captured_at, id',
+                (str(patient_id), str(wound_id))
+            ).fetchall()
+
+        captures = []
+        for row in rows:
+            capture = {
+                'captured_at': row['captured_at'],
+                'capture_key': row['capture_key'],
+                'area_pixels': row['area_pixels'],
+                'bounding_box': {'x': row['bbox_x'], 'y': row['bbox_y'],
+                                 'w': row['bbox_w'], 'h': row['bbox_h']},
+                'circularity': row['circularity'],
+                'color_ratios': json.loads(row['color_ratios']),
+                'risk': row['risk'],
+                'infection_risk': row['infection_risk']
+            }
+            if include_masks:
+                capture['mask'] = decode_mask_rle(row['mask_rle'])
+            captures.append(capture)
+        return captures
+
+    def wounds(self, patient_id: str) -> List[str]:
+        """Wound ids recorded for a patient"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT wound_id FROM captures WHERE patient_id = ? ORDER BY wound_id',
+                (str(patient_id),)
+            ).fetchall()
+        return [row['wound_id'] for row in rows]
+
+    def trend(self, patient_id: str, wound_id: str) -> Dict[str, Any]:
+        """Healing trend over a wound's full series"""
+        return summarize_trend(patient_id, wound_id, self.series(patient_id, wound_id))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _days_between(start: str, end: str) -> float:
+    return (parse_timestamp(end) - parse_timestamp(start)).total_seconds() / 86400
+
+
+def summarize_trend(patient_id: str, wound_id: str, captures: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Healing rate, status and worsening alerts for a series of captures (oldest first)"""
+    summary = {
+        'patient_id': patient_id,
+        'wound_id': wound_id,
+        'captures': len(captures),
+        'healing_status': 'Insufficient data',
+        'healing_rate_percent_per_day': None,
+        'area_change_percent': None,
+        'days_tracked': 0.0,
+        'alerts': [],
+        'series': [{'captured_at': c['captured_at'], 'area_pixels': c['area_pixels'], 'risk': c['risk']}
+                   for c in captures]
+    }
+    if len(captures) < 2:
+        return summary
+
+    first, previous, latest = captures[0], captures[-2], captures[-1]
+    days = np.array([_days_between(first['captured_at'], c['captured_at']) for c in captures])
+    areas = np.array([c['area_pixels'] for c in captures], dtype=np.float64)
+    summary['days_tracked'] = round(float(days[-1]), 2)
+
+    if areas[0] > 0:
+        summary['area_change_percent'] = round(float((areas[-1] - areas[0]) / areas[0] * 100), 2)
+        # Least-squares slope of area over time, relative to the first capture
+        if days[-1] > 0:
+            slope = np.polyfit(days, areas, 1)[0]
+            summary['healing_rate_percent_per_day'] = round(float(-slope / areas[0] * 100), 2)
+
+    change = summary['area_change_percent']
+    if change is None:
+        pass
+    elif change < -SIGNIFICANT_CHANGE_PERCENT:
+        summary['healing_status'] = 'Improving'
+    elif change > SIGNIFICANT_CHANGE_PERCENT:
+        summary['healing_status'] = 'Worsening'
+    else:
+        summary['healing_status'] = 'Stable'
+
+    alerts = summary['alerts']
+    if previous['area_pixels'] > 0:
+        step = (latest['area_pixels'] - previous['area_pixels']) / previous['area_pixels'] * 100
+        if step > SIGNIFICANT_CHANGE_PERCENT:
+            alerts.append(f"Wound grew {step:.1f}% since the previous capture")
+
+    growth_streak = 0
+    for earlier, later in zip(captures[:-1], captures[1:]):
+        growth_streak = growth_streak + 1 if later['area_pixels'] > earlier['area_pixels'] else 0
+    if growth_streak >= 2:
+        alerts.append(f"Wound has grown in {growth_streak} consecutive captures")
+
+    def discharge(capture):
+        ratios = capture['color_ratios']
+        return ratios.get('yellow', 0.0) + ratios.get('green', 0.0)
+
+    if discharge(latest) - discharge(previous) > DISCHARGE_ALERT_DELTA:
+        alerts.append("More yellow/green discharge than the previous capture - possible infection")
+
+    risk_order = ['NONE', 'LOW', 'MODERATE', 'CRITICAL']
+    if (latest['risk'] in risk_order and previous['risk'] in risk_order
+            and risk_order.index(latest['risk']) > risk_order.index(previous['risk'])):
+        alerts.append(f"Risk rose from {previous['risk']} to {latest['risk']}")
+
+    return summary
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Trauma Eye - Live Stream Analysis
+Continuous guidance while the phone is held over a wound. Frames are analyzed
+at a reduced working resolution; between scene changes the previous frame's
+wound region is used as a prior, so only that region is re-segmented, checked
+for infection and judged for exposure and focus. When analysis falls behind the
+source, stale frames are dropped rather than queued.
+
+Usage:
+    python3 wound_stream.py capture.mp4          # NDJSON events on stdout
+    python3 wound_stream.py 0 --working-edge 480  # camera index 0
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import cv2
+import numpy as np
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from trauma_eye import WoundAnalyzer, FrameContext
+
+
+class StreamingWoundAnalyzer:
+    """Per-frame quality, risk and measurements over a sequence of frames"""
+
+    PIXEL_CHANGE = 25
+
+    def __init__(self, analyzer: WoundAnalyzer = None, working_edge: int = 640,
+                 scene_change_threshold: float = 0.05, roi_padding: float = 0.25,
+                 full_every: int = 30):
+        """
+        Args:
+            analyzer: WoundAnalyzer supplying thresholds and stages
+            working_edge: Long edge of the level segmentation runs on
+            scene_change_threshold: Fraction of a 64px-wide gray thumbnail whose
+                pixels moved by more than PIXEL_CHANGE levels that counts as a
+                new scene
+            roi_padding: Fraction of the wound box added on each side of the
+                tracking region
+            full_every: Force a full-frame segmentation this often (frames), so
+                wounds entering the view are picked up
+        """
+        self.analyzer = analyzer or WoundAnalyzer(color_lut=True)
+        self.working_edge = working_edge
+        self.scene_change_threshold = scene_change_threshold
+        self.roi_padding = roi_padding
+        self.full_every = full_every
+        self.reset()
+
+    def reset(self):
+        """Start a new stream: forget the tracking prior and counters"""
+        self._clear_prior()
+        self._frames_since_full = 0
+        self.frame_index = 0
+        self.dropped_frames = 0
+
+    def process(self, frame: np.ndarray, timestamp: float = None) -> Dict[str, Any]:
+        """Analyze one BGR frame and return its event"""
+        start = time.perf_counter()
+        analyzer = self.analyzer
+
+        ctx = FrameContext(frame, analyzer)
+        work = ctx.working_level(self.working_edge)
+
+        event = {
+            'frame': self.frame_index,
+            'timestamp': timestamp,
+            'dropped_frames': self.dropped_frames
+        }
+        self.frame_index += 1
+
+        # Re-segment everything on a scene change, otherwise only the prior ROI
+        thumb = self._thumbnail(work.img)
+        mode = 'full' if self._needs_full_segmentation(thumb) else 'tracked'
+
+        quality = self._check_quality(ctx, work, self._roi if mode == 'tracked' else None)
+        event['photo_quality'] = quality
+        if not quality['is_acceptable']:
+            self._clear_prior()
+            event.update({'mode': 'skipped', 'risk': 'UNKNOWN', 'confidence': 0.0})
+            return self._finish(event, start)
+
+        if mode == 'tracked':
+            region, labels, contours = self._find_wounds(work, self._roi)
+            if not contours:
+                # Lost the wound inside the prior region; fall back to the whole frame
+                mode = 'full'
+
+        if mode == 'full':
+            region, labels, contours = self._find_wounds(work)
+            self._reference_thumb = thumb
+            self._frames_since_full = 0
+        else:
+            self._frames_since_full += 1
+
+        event['mode'] = mode
+        if not contours:
+            self._clear_prior()
+            event.update({'risk': 'NONE', 'confidence': 0.0, 'wound_count': 0})
+            return self._finish(event, start)
+
+        self._roi = self._next_roi(work, contours)
+
+        # The event describes the largest wound, scored as analyze scores it
+        measurements = analyzer._measure_wound(contours[0])
+        wound_types = analyzer._classify_wound(ctx, contours[0])
+        infection_analysis = analyzer._detect_wound_infections(region, labels)[0]
+        risk_level, confidence = analyzer._calculate_risk(measurements, wound_types, infection_analysis)
+
+        event.update({
+            'risk': risk_level,
+            'confidence': confidence,
+            'message': analyzer._generate_message(risk_level, wound_types),
+            'wound_count': len(contours),
+            'wound_types': wound_types,
+            'infection_risk': infection_analysis['risk_level'],
+            'measurements': measurements
+        })
+        return self._finish(event, start)
+
+    def run(self, frames: Iterable, fps: float = None) -> Iterator[Dict[str, Any]]:
+        """
+        Analyze a frame sequence, dropping frames when analysis falls behind
+        With `fps`, frames are treated as arriving in real time at that rate
+        (e.g. video file playback) and any frame that is already older than the
+        next one's due time is skipped. Without it every frame is processed.
+        """
+        self.reset()
+        start = time.perf_counter()
+        interval = 1.0 / fps if fps else None
+
+        for index, frame in enumerate(frames):
+            timestamp = index * interval if interval else None
+            if interval is not None:
+                elapsed = time.perf_counter() - start
+                if elapsed > timestamp + interval:
+                    self.dropped_frames += 1
+                    continue
+            yield self.process(frame, timestamp)
+
+    def _clear_prior(self):
+        self._roi = None  # (x0, y0, x1, y1) at working resolution
+        self._reference_thumb = None
+
+    def _finish(self, event: Dict[str, Any], start: float) -> Dict[str, Any]:
+        event['processing_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return event
+
+    def _thumbnail(self, img: np.ndarray) -> np.ndarray:
+        height, width = img.shape[:2]
+        size = (64, max(1, round(64 * height / width)))
+        return cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+    def _needs_full_segmentation(self, thumb: np.ndarray) -> bool:
+        if self._roi is None or self._reference_thumb is None:
+            return True
+        if self._reference_thumb.shape != thumb.shape:
+            return True
+        if self._frames_since_full >= self.full_every:
+            return True
+        changed = cv2.countNonZero(cv2.compare(cv2.absdiff(thumb, self._reference_thumb),
+                                               self.PIXEL_CHANGE, cv2.CMP_GT))
+        return changed > self.scene_change_threshold * thumb.size
+
+    def _check_quality(self, ctx: FrameContext, work: FrameContext,
+                       roi: Optional[Tuple[int, int, int, int]]) -> Dict[str, Any]:
+        """
+        Photo quality of the frame; with a tracking region, brightness and
+        sharpness come from that region alone, at full resolution (where
+        blur_threshold applies)
+        """
+        if roi is None:
+            return self.analyzer._check_photo_quality(ctx)
+        x0, y0, x1, y1 = (int(round(value / work.scale)) for value in roi)
+        region = FrameContext(ctx.img[y0:y1, x0:x1], self.analyzer)
+        height, width = ctx.img.shape[:2]
+        return self.analyzer._quality_report(width, height, region.brightness, region.sharpness)
+
+    def _find_wounds(self, work: FrameContext, roi: Tuple[int, int, int, int] = None
+                     ) -> Tuple[FrameContext, List[int], List[np.ndarray]]:
+        """
+        (region, labels, full-resolution contours) of the wounds inside `roi`
+        of the working level, or anywhere on it; labels are components of
+        region, the context segmented, largest wound first
+        """
+        analyzer = self.analyzer
+        if roi is None:
+            region = work
+            found = analyzer._find_wounds(work)
+        else:
+            x0, y0, x1, y1 = roi
+            region = FrameContext(work.img[y0:y1, x0:x1], analyzer, work.scale)
+            origin = np.array([x0, y0], np.int32)
+            found = [(label, contour + origin) for label, contour in analyzer._find_wounds(region)]
+        labels, contours = analyzer._rank_wounds(work, found)
+        return region, labels, contours
+
+    def _next_roi(self, work: FrameContext, contours) -> Tuple[int, int, int, int]:
+        """Padded box around this frame's wounds, at working resolution"""
+        points = np.concatenate(contours) * work.scale
+        x, y, w, h = cv2.boundingRect(np.round(points).astype(np.int32))
+        pad_x = int(w * self.roi_padding) + 8
+        pad_y = int(h * self.roi_padding) + 8
+
+        height, width = work.img.shape[:2]
+        return (max(x - pad_x, 0), max(y - pad_y, 0),
+                min(x + w + pad_x, width), min(y + h + pad_y, height))
+
+
+class LatestFrameReader:
+    """
+    Reads a live capture on a background thread, keeping only the newest frame
+    Slow analysis then skips stale frames instead of building up lag.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.dropped_frames = 0
+        self._frame = None
+        self._done = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        while True:
+            ok, frame = self.capture.read()
+            with self._condition:
+                if not ok:
+                    self._done = True
+                    self._condition.notify()
+                    return
+                if self._frame is not None:
+                    self.dropped_frames += 1
+                self._frame = frame
+                self._condition.notify()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while True:
+            with self._condition:
+                while self._frame is None and not self._done:
+                    self._condition.wait()
+                if self._frame is None:
+                    return
+                frame, self._frame = self._frame, None
+            yield frame
+
+
+def _open_capture(source: str) -> Optional[cv2.VideoCapture]:
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    return capture if capture.isOpened() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live wound analysis over a video file or camera')
+    parser.add_argument('source', help='video file path or camera index')
+    parser.add_argument('--working-edge', type=int, default=640,
+                        help='long edge of the segmentation level (default: 640)')
+    parser.add_argument('--realtime', action='store_true',
+                        help='pace a video file at its native fps and drop frames that fall behind')
+    args = parser.parse_args()
+
+    capture = _open_capture(args.source)
+    if capture is None:
+        print(json.dumps({'error': True, 'message': f'Could not open video source {args.source}'}), flush=True)
+        sys.exit(1)
+
+    stream = StreamingWoundAnalyzer(working_edge=args.working_edge)
+    is_camera = args.source.isdigit()
+
+    if is_camera:
+        reader = LatestFrameReader(capture)
+        events = (dict(stream.process(frame), dropped_frames=reader.dropped_frames) for frame in reader)
+    else:
+        def frames():
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        fps = capture.get(cv2.CAP_PROP_FPS) if args.realtime else None
+        events = stream.run(frames(), fps=fps or None)
+
+    for event in events:
+        print(json.dumps(event), flush=True)
+    capture.release()
+
+
+if __name__ == '__main__':
+    main()